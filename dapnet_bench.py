@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+
+# copyright (c) 2022 by Rainer Fiedler DO6UK
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+# benchmark of the whole chain on localhost:
+# multimon-ng lines -> dapnet_sock.py -> dapnet_dau.py -> fake transmitter
+#
+# e.g. ./dapnet_bench.py --messages 2000 --ack-delay 5
+#
+# --parser measures lines per second of the multimon-ng parser only - before and after the fast path
+# --split lets the fake transmitter send its replies byte by byte like a slow link - handshake must not suffer
+# --combined runs the receiver inside the core (dapnet_dau.py --receiver) - no unix socket in between
+# --decoder measures pocsag_rx.py on synthetic audio of pocsag_gen.py - throughput and message errors per snr
+
+import os,sys,io,re,time,json,asyncio,argparse
+import multimon, pocsag_gen
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+BENCH_PATTERN = re.compile(r'^#(..)\s\d:\d:[0-9a-f]+:\d:bench (\d+) ')
+
+# rics of bench messages start here - far away from blacklisted rics
+BENCH_RIC = 100000
+
+class FakeTransmitter:
+	# logs into the core like a transmitter, answers time-sync and acks every message after ack_delay
+	
+	def __init__(self, ack_delay, callsign = 'do0tst', split = False):
+		self.ack_delay = ack_delay
+		self.split = split
+		self.callsign = callsign
+		self.received = {}			# bench id -> time received
+		self.handshake = None		# seconds from connect to first message
+		self.connected = asyncio.Event()
+	
+	async def run(self, port):
+		for i in range(0,50):
+			try:
+				reader, writer = await asyncio.open_connection('127.0.0.1', port)
+				break
+			except OSError:
+				await asyncio.sleep(0.1)
+		else:
+			raise RuntimeError('core not listening on port {}'.format(port))
+		
+		start = time.monotonic()
+		await self.reply(writer, '[FakePager v1.0 {} 00000]\r\n'.format(self.callsign).encode('utf-8'))
+		loop = asyncio.get_running_loop()
+		
+		while True:
+			line = await reader.readline()
+			if not line:
+				break
+			line = line.decode('utf-8').strip()
+			
+			if line.startswith('2:'):
+				await self.reply(writer, '{}:0000\r\n'.format(line).encode('utf-8'))
+			elif line.startswith('#'):
+				if self.handshake is None:
+					self.handshake = time.monotonic() - start
+					self.connected.set()
+				bench = BENCH_PATTERN.match(line)
+				if bench:
+					self.received[int(bench[2])] = time.monotonic()
+				ack = '#{} +\r\n'.format(line[1:3]).encode('utf-8')
+				if self.ack_delay:
+					loop.call_later(self.ack_delay, writer.write, ack)
+				else:
+					await self.reply(writer, ack)
+			else:
+				await self.reply(writer, b'+\r\n')
+		
+		writer.close()
+		return
+	
+	async def reply(self, writer, data):
+		if not self.split:
+			writer.write(data)
+			return
+		
+		for i in range(0, len(data)):
+			writer.write(data[i:i + 1])
+			await writer.drain()
+			await asyncio.sleep(0.001)
+		return
+
+# parser of dapnet_sock.py before the fast path - reference of --parser
+LEGACY_MULTIMON = re.compile(r'^POCSAG1200:\sAddress:\s+(\d+)\s+Function:\s+(\d)\s+(Alpha|Numeric):\s+(.+)')
+
+def legacy_clean_message(msg):
+	remove = ['DEL','NUL','DLE','SOH','DC','STX','ETX','EOT','ENQ','NAK','ACK','SYN','BEL','ETB','BS','CAN','HT','EM','LF','SUB','VT','ESC','FF','FS','CR','GS','SO','RS','SI','US']
+	for char in remove:
+		msg = msg.replace('<{}>'.format(char),'')
+	
+	return msg
+
+def legacy_parse(stream):
+	result = []
+	for line in stream:
+		match_data = LEGACY_MULTIMON.match(line.rstrip())
+		if match_data:
+			m_type = 6 if match_data[3].lower() == 'alpha' else 5
+			result.append((m_type, 1, int(match_data[1]), int(match_data[2]), legacy_clean_message(match_data[4])))
+	
+	return result
+
+def chunked_parse(data, chunk = 65536):
+	result = []
+	buffer = b''
+	for i in range(0, len(data), chunk):
+		lines, buffer = multimon.split_lines(buffer, data[i:i + chunk])
+		for line in lines:
+			msg_data = multimon.parse_line(line)
+			if msg_data:
+				result.append(msg_data)
+	
+	return result
+
+def parser_lines(count, length):
+	# mix of multimon-ng output - alpha, alpha with control characters, numeric and status lines
+	
+	lines = []
+	padding = 'x' * max(0, length - 18)
+	for i in range(0, count):
+		if i % 10 < 6:
+			lines.append('POCSAG1200: Address: {:7}  Function: 3  Alpha:   bench {:08} {}<NUL>'.format(BENCH_RIC + i, i, padding))
+		elif i % 10 < 8:
+			lines.append('POCSAG1200: Address: {:7}  Function: 3  Alpha:   <ETX>bench<LF>{:08}<CR><LF>{}<EOT><NUL>'.format(BENCH_RIC + i, i, padding))
+		elif i % 10 < 9:
+			lines.append('POCSAG1200: Address: {:7}  Function: 0  Numeric: {:08}'.format(BENCH_RIC + i, i))
+		else:
+			lines.append('POCSAG1200: Address: {:7}  Function: 2'.format(BENCH_RIC + i))
+	
+	return ('\n'.join(lines) + '\n').encode('utf-8')
+
+def parser_bench(args):
+	data = parser_lines(args.messages, args.length)
+	
+	start = time.perf_counter()
+	before = legacy_parse(io.TextIOWrapper(io.BytesIO(data), encoding='utf-8'))
+	legacy = time.perf_counter() - start
+	
+	start = time.perf_counter()
+	after = chunked_parse(data)
+	fast = time.perf_counter() - start
+	
+	if before != after:
+		raise RuntimeError('parsers disagree')
+	
+	return {
+		'lines': args.messages,
+		'messages': len(after),
+		'before': args.messages / legacy,
+		'after': args.messages / fast,
+		'speedup': legacy / fast,
+	}
+
+def decoder_bench(args):
+	import pocsag_rx
+	
+	rate = 22050
+	messages = [(6, args.speed, BENCH_RIC + i, 3, 'bench {:08} {}'.format(i, 'x' * max(0, args.length - 14))) for i in range(0, args.messages)]
+	result = {'messages': args.messages, 'speed': args.speed, 'snr': {}}
+	for snr in args.snr:
+		samples = pocsag_gen.generate(messages, rate, snr=snr, offset=0.05, ppm=50, seed=snr)
+		samples = pocsag_rx.numpy.frombuffer(samples.tobytes(), pocsag_rx.numpy.int16)
+		receiver = pocsag_rx.Receiver(args.speed, rate)
+		
+		decoded = []
+		start = time.perf_counter()
+		for i in range(0, len(samples), 4096):
+			decoded.extend(receiver.feed(samples[i:i + 4096]))
+		receiver.decoder.flush()
+		decoded.extend(receiver.decoder.take())
+		duration = time.perf_counter() - start
+		
+		correct = len(set(decoded) & set(messages))
+		result['snr'][snr] = {
+			'correct': correct,
+			'lost': args.messages - correct,
+			'wrong': len(decoded) - correct,
+			'realtime': len(samples) / rate / duration,
+		}
+	
+	return result
+
+def percentile(values, p):
+	if not values:
+		return 0
+	values = sorted(values)
+	return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+async def bench(args):
+	socket_path = '/tmp/dapnet_bench_{}.s'.format(os.getpid())
+	python = sys.executable
+	
+	# core without pipe, every timeslot open - only the software chain is measured
+	receiver_args = ['--native'] if args.native else []
+	combined_args = ['--receiver', *receiver_args] if args.combined else []
+	core = await asyncio.create_subprocess_exec(python, os.path.join(BASE_DIR,'dapnet_dau.py'), '--silent',
+		'--port={}'.format(args.port), '--socket={}'.format(socket_path), '--pipe=', '--slots=', '--stats=0', '--api=0', '--spool=', '--config=',
+		*combined_args, stdin=asyncio.subprocess.PIPE if args.combined else None, stdout=asyncio.subprocess.DEVNULL if not args.verbose else None)
+	
+	transmitter = FakeTransmitter(args.ack_delay / 1000, split = args.split)
+	tx_task = asyncio.create_task(transmitter.run(args.port))
+	await asyncio.wait_for(transmitter.connected.wait(), 10)
+	
+	# with --native dapnet_sock.py decodes synthetic audio instead of multimon-ng lines
+	feed = []
+	padding = 'x' * max(0, args.length - 18)
+	for i in range(0,args.messages):
+		if args.native:
+			message = (6, 1, BENCH_RIC + i, 3, 'bench {:08} {}'.format(i, padding))
+			feed.append(pocsag_gen.generate([message], gap=0.02, seed=i).tobytes())
+		else:
+			feed.append('POCSAG1200: Address: {:7}  Function: 3  Alpha:   bench {:08} {}\n'.format(BENCH_RIC + i, i, padding).encode('utf-8'))
+	
+	if args.combined:
+		receiver = core
+	else:
+		receiver = await asyncio.create_subprocess_exec(python, os.path.join(BASE_DIR,'dapnet_sock.py'), '--silent',
+			'--socket={}'.format(socket_path), '--stats=0', '--config=', *receiver_args,
+			stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.DEVNULL if not args.verbose else None)
+	
+	# feed multimon-ng lines or audio
+	sent = {}
+	started = time.monotonic()
+	for i in range(0,args.messages):
+		sent[i] = time.monotonic()
+		receiver.stdin.write(feed[i])
+		if args.rate:
+			await receiver.stdin.drain()
+			await asyncio.sleep(max(0, started + (i + 1) / args.rate - time.monotonic()))
+	await receiver.stdin.drain()
+	
+	# wait until all messages arrived or nothing arrives anymore
+	last_count = -1
+	last_change = time.monotonic()
+	while len(transmitter.received) < args.messages and time.monotonic() - last_change < args.drain:
+		await asyncio.sleep(0.05)
+		if len(transmitter.received) != last_count:
+			last_count = len(transmitter.received)
+			last_change = time.monotonic()
+	
+	procs = [core] if args.combined else [receiver, core]
+	for proc in procs:
+		try:
+			proc.terminate()
+		except ProcessLookupError:
+			pass
+	for proc in procs:
+		try:
+			await asyncio.wait_for(proc.wait(), 15)
+		except asyncio.TimeoutError:
+			proc.kill()
+	tx_task.cancel()
+	
+	latency = [(transmitter.received[i] - sent[i]) * 1000 for i in transmitter.received if i in sent]
+	received = len(transmitter.received)
+	duration = (max(transmitter.received.values()) - started) if received else 0
+	
+	return {
+		'messages': args.messages,
+		'received': received,
+		'dropped': args.messages - received,
+		'throughput': received / duration if duration else 0,
+		'latency_p50': percentile(latency, 50),
+		'latency_p99': percentile(latency, 99),
+		'latency_max': max(latency) if latency else 0,
+		'handshake': (transmitter.handshake or 0) * 1000,
+		'ack_delay': args.ack_delay,
+		'rate': args.rate,
+	}
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='throughput and latency of dapnet_sock.py and dapnet_dau.py')
+	parser.add_argument('--messages', type=int, default=1000, help='number of messages fed to dapnet_sock.py')
+	parser.add_argument('--rate', type=float, default=0, help='messages per second - 0 feeds as fast as possible')
+	parser.add_argument('--length', type=int, default=40, help='characters per message')
+	parser.add_argument('--ack-delay', type=float, default=0, help='ms the fake transmitter waits before acking')
+	parser.add_argument('--split', action='store_true', help='fake transmitter sends replies byte by byte')
+	parser.add_argument('--drain', type=float, default=5, help='seconds to wait for further messages before giving up')
+	parser.add_argument('--port', type=int, default=43499, help='tcp port of core under test')
+	parser.add_argument('--json', action='store_true', help='print result as json')
+	parser.add_argument('--verbose', action='store_true', help='show output of core and receiver')
+	parser.add_argument('--parser', action='store_true', help='only measure the multimon-ng parser - --messages is the number of lines')
+	parser.add_argument('--decoder', action='store_true', help='only measure pocsag_rx.py on synthetic audio (needs numpy)')
+	parser.add_argument('--snr', type=float, action='append', help='snr in dB of --decoder - may be repeated, default 0 3 6 10')
+	parser.add_argument('--speed', type=int, default=1, help='speed of --decoder (0=512, 1=1200, 2=2400)')
+	parser.add_argument('--combined', action='store_true', help='run the receiver inside the core (dapnet_dau.py --receiver) instead of dapnet_sock.py')
+	parser.add_argument('--native', action='store_true', help='feed synthetic audio to dapnet_sock.py --native instead of multimon-ng lines (needs numpy)')
+	args = parser.parse_args()
+	
+	if args.parser:
+		result = parser_bench(args)
+	elif args.decoder:
+		args.snr = args.snr or [0, 3, 6, 10]
+		result = decoder_bench(args)
+	else:
+		result = asyncio.run(bench(args))
+	
+	if args.json:
+		print(json.dumps(result))
+	elif args.decoder:
+		print('[bench]','messages {messages} speed {speed}'.format(**result))
+		for snr, data in result['snr'].items():
+			print('[bench]','snr {:4.1f}dB correct {correct} lost {lost} wrong {wrong} decoder {realtime:.0f}x realtime'.format(snr, **data))
+	elif args.parser:
+		print('[bench]','lines {lines} messages {messages}'.format(**result))
+		print('[bench]','before {before:.0f} lines/s after {after:.0f} lines/s speedup {speedup:.1f}x'.format(**result))
+	else:
+		print('[bench]','messages {messages} received {received} dropped {dropped}'.format(**result))
+		print('[bench]','throughput {throughput:.1f} msg/s'.format(**result))
+		print('[bench]','latency p50 {latency_p50:.1f}ms p99 {latency_p99:.1f}ms max {latency_max:.1f}ms'.format(**result))
+		print('[bench]','handshake {handshake:.1f}ms ack delay {ack_delay:.1f}ms'.format(**result))
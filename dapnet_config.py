@@ -0,0 +1,101 @@
+# copyright (c) 2022 by Rainer Fiedler DO6UK
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+# config file of dapnet_dau and dapnet_sock - one section per script, settings like in the scripts:
+#
+# [dapnet_dau]
+# client_slots = 2389D
+# msg_blocktime = 103
+#
+# [dapnet_sock]
+# ric_blacklist = [8, 208, 224, 200, 216, 2504]
+#
+# values are converted to the type of the setting in the script - settings missing in the file get
+# the value of the script again on reload
+
+import os,ast,configparser
+import dapnet_log
+
+TRUE = ('1', 'true', 'yes', 'on')
+FALSE = ('0', 'false', 'no', 'off')
+
+def convert(value, default):
+	# value of config file as type of default
+	
+	value = value.strip()
+	if isinstance(default, bool):
+		if value.lower() in TRUE:
+			return True
+		if value.lower() in FALSE:
+			return False
+		raise ValueError('expected true or false')
+	if isinstance(default, int):
+		# seconds with int defaults (send_timeout, core_ping, ...) may be fractional
+		try:
+			return int(value)
+		except ValueError:
+			return float(value)
+	if isinstance(default, float):
+		return float(value)
+	if isinstance(default, (list, dict)):
+		result = ast.literal_eval(value)
+		if isinstance(default, list) and isinstance(result, (tuple, int, str)):
+			result = list(result) if isinstance(result, tuple) else [result]
+		if not isinstance(result, type(default)):
+			raise ValueError('expected {}'.format(type(default).__name__))
+		return result
+	
+	# strings may be quoted like in the script
+	if len(value) >= 2 and value[0] == value[-1] and value[0] in '\'"':
+		value = value[1:-1]
+	return value
+
+def read(path, section, defaults, skip = ()):
+	# settings of section - defaults overlaid with the values of the file, names in skip are left out
+	# returns None if file is missing
+	
+	parser = configparser.ConfigParser(interpolation=None)
+	parser.optionxform = str
+	if not parser.read(path, encoding='utf-8'):
+		return None
+	
+	values = {name: value for name, value in defaults.items() if name not in skip}
+	if not parser.has_section(section):
+		return values
+	
+	for name, value in parser.items(section):
+		if name not in defaults:
+			dapnet_log.error('[CONFIG]','unknown setting',name)
+		elif name not in skip:
+			try:
+				values[name] = convert(value, defaults[name])
+			except (ValueError, SyntaxError) as e:
+				dapnet_log.error('[CONFIG]','invalid value of',name,value,'-',e)
+	
+	return values
+
+def update(settings, values):
+	# apply values to settings (globals of script) - returns names of settings changed
+	
+	changed = [name for name, value in values.items() if settings[name] != value]
+	for name in changed:
+		settings[name] = values[name]
+	
+	return changed
+
+def mtime(path):
+	# time of last change of config file - None if missing
+	
+	try:
+		return os.stat(path).st_mtime
+	except OSError:
+		return None
@@ -12,9 +12,9 @@
 #  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 #  GNU General Public License for more details.
 
-import time,os,sys,socket,re,datetime,signal
-from queue import Queue
-from threading import Thread
+import time,os,sys,re,datetime,signal,asyncio,hashlib,json,threading,concurrent.futures
+import pocsag, dapnet_log, dapnet_stats, dapnet_spool, dapnet_config, dapnet_proto, dapnet_timer, dapnet_limit
+from collections import OrderedDict, deque
 
 # host/ip of fake-core
 tcp_address = "127.0.0.1"
@@ -37,535 +37,1794 @@ server_message_socket = '/tmp/dapnet_dau.s'
 server_message_pipe = './dapnet_dau.fifo'
 use_message_pipe = True
 
+# maximum number of transmitters served at the same time
+client_max = 4
+
+# timeslots per transmitter callsign - transmitters not listed get client_slots
+client_slots_by_call = {}
+
+# fastest speed (0=512, 1=1200, 2=2400) the pagers of a ric can receive, e.g. {1234: 2}
+# forwarded messages are sent at this speed if it is faster than the one they came in with - 2400 needs half the
+# airtime of 1200; rics not listed get speed_upgrade, -1 keeps the speed received
+ric_speed = {}
+speed_upgrade = -1
+
+# seconds messages are released to transmitter ahead of its next timeslot
+slot_lead = 1.0
+
+# maximum number of messages waiting per transmitter - SOCK, PIPE and API wait for space
+msg_queue_max = 1000
+
+# local http/json api to inject batches of messages - 0 disables
+# e.g. curl -d '{"messages": [{"ric": 1234, "text": "hello"}, "6:1:1235:3:hello"]}' http://127.0.0.1:43435/messages
+api_address = '127.0.0.1'
+api_port = 43435
+
+# seconds the api waits for space in queue before a message is refused as full
+api_wait = 5
+
+# token bucket budgets of incoming messages per source (sock, pipe, api) and per ric - a rate of 0 disables
+# rate is refilled per second, burst is the size of the bucket, airtime counts estimated pocsag airtime in seconds
+# SOCK and PIPE stop reading while their source is over budget, the api waits up to api_wait,
+# messages over the budget of their ric are dropped
+limit_source_rate = 0.0
+limit_source_burst = 100
+limit_source_airtime = 0.0
+limit_source_airtime_burst = 60.0
+limit_ric_rate = 0.0
+limit_ric_burst = 10
+limit_ric_airtime = 0.0
+limit_ric_airtime_burst = 10.0
+
+# seconds of airtime one source may use in its turn before the next source is served (deficit round robin)
+fair_quantum = 1.0
+
+# directory of the on-disk spool - messages are kept per transmitter callsign until acked and
+# replayed after reconnect or restart - empty disables
+spool_dir = './spool'
+
+# seconds spooled messages are kept for a transmitter before they expire
+spool_ttl = 600
+
+# maximum number of messages spooled per transmitter - oldest are dropped first
+spool_max = 10000
+
+# bytes of the newest spool segment before it is compacted - or twice the size of the live messages, if that is more
+spool_segment_max = 1048576
+
+# seconds to wait for each reply of transmitter in handshake - login, time-sync and timeslots
+handshake_timeout = 2
+
 # seconds to check client-conn is still working - will resend 3:+0000
 core_ping = 30
 
+# seconds between beacons of each transmitter - first one is sent after handshake, 0 sends only that one
+beacon_interval = 600
+
+# number of messages sent to transmitter without waiting for their ack - at most 256 (one #XX counter each)
+send_window = 8
+
+# seconds to wait for ack of a message before it will be resent
+send_timeout = 2
+
+# how often a message will be resent (on timeout or retry-response) before it is dropped
+send_retry = 2
+
 # seconds that messages will kept in msg_history - should be 1 cycle of all slots
 msg_blocktime = 103
 
-# enable debugging (more useless information at console ;-)
+# maximum number of messages kept in msg_history - oldest are removed first
+msg_history_max = 20000
+
+# local http port serving runtime metrics in prometheus text format - 0 disables
+stats_address = '127.0.0.1'
+stats_port = 9433
+
+# run the receiver (dapnet_sock) in this process - decoded messages are handed to the queue in memory
+# instead of the unix socket, its settings are read from section [dapnet_sock], can be reached by --receiver in cli
+use_receiver = False
+
+# enable debugging (more useless information at console ;-) - same as log_level = 'debug'
 debug = False
 
-# enable silentmode (mostly no output) can be reached by --silent in cli
+# enable silentmode (mostly no output) can be reached by --silent in cli - same as log_level = 'notice'
 silent = False
 
+# log level of all subsystems: debug, info, notice (start, stop, signals) or error
+log_level = 'info'
+
+# log level per subsystem - first word of the tag in the log in lower case, e.g. {'client': 'debug', 'sock': 'notice'}
+log_levels = {}
+
+# lines waiting for the console - if it is slower than the core, the oldest lines are dropped (and counted) instead of delaying messages
+log_buffer = 10000
+
+# write log lines as json objects (time, level, subsystem, tag, message) instead of text
+log_json = False
+
+# config file with section [dapnet_dau] - overrides settings above, reloaded on SIGHUP or when it changes
+# can be reached by --config= in cli
+config_file = './dapnet.conf'
+
+# seconds between checks of config_file for changes - 0 reloads only on SIGHUP
+config_check = 5
+
 
 ### do not edit below this line
 
+# settings above - may be set in config_file
+config_defaults = {name: value for name, value in globals().items() if not name.startswith('_') and isinstance(value, (str, int, float, list, dict)) and name != 'config_file'}
+
+# settings only applied at start - listeners of transmitters, pipe, stats and spool
+config_restart = ('tcp_address', 'tcp_port', 'server_message_pipe', 'use_message_pipe', 'stats_address', 'stats_port', 'spool_dir', 'use_receiver')
+
 version = '20221205'
 
-LOGIN_PATTERN = re.compile(r'^\[(.+)\s(v.+)\s(\w{2}\d\w{2,3})\s(.+)]')
-TIME_PATTERN = re.compile(r'^2\:(.{4}):(.{4})')
 MSG_PATTERN = re.compile(r'^(\d):(\d):(\d+):(\d):(.+)')
-MSG_ACK_PATTERN = re.compile(r'^#(..)\s([\+])')
 
 send_time_utc = True
 send_time_local = True
 
+# queue priorities - protocol data first, then time messages and beacon, then forwarded messages
+PRIO_DATA = 0
+PRIO_TIME = 1
+PRIO_MSG = 2
+
+# dapnet timeslots 0-F last 6.4 seconds each - one cycle of all slots is 102.4 seconds
+SLOT_TIME = 6.4
+SLOT_COUNT = 16
+
 running = True
-client_online = False
 
 bind_max_try = 10
 
-msg_history = {}
+# seconds after an unterminated message on SOCK is taken as complete - only for legacy clients that
+# never sent a newline on their connection, once a newline was seen partial lines wait for the rest
+sock_flush_timeout = 2
+
+# digest of ric and message -> time sent - in order of time sent
+msg_history = OrderedDict()
+
+# connected transmitters - every message is fanned out to all of them
+transmitters = []
+
+# transmitter callsign (lower case) -> spool - messages for known transmitters are spooled while they are offline
+spools = {}
 
-sock_reader = None
-pipe_reader = None
 server = None
-client_conn = None
+sock_server = None
+sock_path = None
+sock_clients = {}			# writer -> handler of connected SOCK clients
+api_server = None
+stats_server = None
+stop_event = None
+scheduler = None
+timer_jobs = {}
+source_budget = dapnet_limit.Budget()
+ric_budget = dapnet_limit.Budget()
+queue_space = None
+core_loop = None
+receiver = None
+core_instance = None				# Core of this process - settings are module globals, there can be only one
+
+# messages of the receiver in this process handed to the core and not queued yet
+receiver_window = 64
+receiver_pending = threading.BoundedSemaphore(receiver_window)
 
-print('[dau_core]','starting dapnet_dau v%s ...'%version)
+# settings given at cli - set by configure()
+config_mtime = None
+config_cli = set()
 
-if '--silent' in sys.argv:
-	if debug: print('[dau_core]','running silent mode will set  debug = False')
-	silent = True
-	debug = False
+# runtime metrics - served at stats_port
+stats_messages_in = dapnet_stats.Counter('dapnet_dau_messages_in_total','messages received per source')
+stats_invalid = dapnet_stats.Counter('dapnet_dau_messages_invalid_total','invalid messages received per source')
+stats_upgraded = dapnet_stats.Counter('dapnet_dau_speed_upgraded_total','messages sent faster than received per speed')
+stats_limited = dapnet_stats.Counter('dapnet_dau_limited_total','messages dropped over budget per source and limit (source, ric)')
+stats_throttled = dapnet_stats.Counter('dapnet_dau_throttled_total','messages delayed by the budget of their source')
+stats_throttle_wait = dapnet_stats.Histogram('dapnet_dau_throttle_seconds','seconds messages waited for the budget of their source')
+stats_history_hits = dapnet_stats.Counter('dapnet_dau_history_hits_total','messages dropped in blocktime')
+stats_messages_out = dapnet_stats.Counter('dapnet_dau_messages_out_total','messages sent per transmitter')
+stats_responses = dapnet_stats.Counter('dapnet_dau_responses_total','messages per transmitter and result (ack, nak, retry, timeout, dropped)')
+stats_ack_latency = dapnet_stats.Histogram('dapnet_dau_ack_latency_seconds','seconds from sending a message to its ack')
+stats_queue_delay = dapnet_stats.Histogram('dapnet_dau_queue_delay_seconds','seconds messages waited in queue for a transmitter')
+stats_handshake = dapnet_stats.Histogram('dapnet_dau_handshake_seconds','seconds from connect to end of transmitter handshake')
+stats_handshake_phase = dapnet_stats.Histogram('dapnet_dau_handshake_phase_seconds','seconds of handshake phases (login, time, slots)')
+stats_connections = dapnet_stats.Counter('dapnet_dau_connections_total','transmitter connections')
+stats_spilled = dapnet_stats.Counter('dapnet_dau_slot_spilled_total','messages not fitting in the timeslot window they were queued for')
+stats_fill = dapnet_stats.Histogram('dapnet_dau_slot_fill_ratio','airtime used of timeslot windows',(0.1,0.25,0.5,0.75,0.9,1))
+stats_timer_late = dapnet_stats.Histogram('dapnet_dau_timer_lateness_seconds','seconds periodic jobs ran after their deadline',(0.0001,0.0005,0.001,0.005,0.01,0.05,0.1,0.5,1,5))
+stats_timer_jitter = dapnet_stats.Histogram('dapnet_dau_timer_jitter_seconds','change of lateness between runs of periodic jobs',(0.0001,0.0005,0.001,0.005,0.01,0.05,0.1,0.5,1,5))
+dapnet_stats.Gauge('dapnet_dau_transmitters','transmitters connected',lambda: len(transmitters))
+dapnet_stats.Gauge('dapnet_dau_queue_depth','messages waiting per transmitter',
+	lambda: {(('transmitter',tx.callsign),): sum(len(queue) for queue in tx.msg_queue) + len(tx.send_retries) for tx in transmitters if tx.callsign})
+dapnet_stats.Gauge('dapnet_dau_pending','messages waiting for ack per transmitter',
+	lambda: {(('transmitter',tx.callsign),): len(tx.msg_pending) + len(tx.data_pending) for tx in transmitters if tx.callsign})
+dapnet_stats.Gauge('dapnet_dau_history_entries','messages in msg_history',lambda: len(msg_history))
+dapnet_stats.Gauge('dapnet_dau_spool_entries','messages spooled per transmitter',
+	lambda: {(('transmitter',callsign),): len(spool.live) for callsign, spool in list(spools.items())})
+dapnet_stats.Counter('dapnet_dau_spool_expired_total','spooled messages dropped after spool_ttl',
+	lambda: {(('transmitter',callsign),): spool.expired for callsign, spool in list(spools.items())})
 
-def time_skyper ():
-	now = datetime.datetime.utcnow()
+def configure_log():
+	# debug and silent are shortcuts of log_level
+	
+	try:
+		default_level = dapnet_log.DEBUG if debug else dapnet_log.level_value(log_level)
+		if silent:
+			default_level = max(default_level, dapnet_log.NOTICE)
+		dapnet_log.configure(default_level, log_levels, log_json, log_buffer)
+	except ValueError as e:
+		dapnet_log.error('[CONFIG]','ERROR:',e)
+	
+	return
+
+def configure(argv = ()):
+	global config_file, config_mtime, config_cli, silent, debug, tcp_port, client_slots, server_message_socket, use_message_socket
+	global server_message_pipe, use_message_pipe, stats_port, api_port, spool_dir, use_receiver
+	
+	# apply config_file and cli arguments (e.g. sys.argv[1:]) to the settings above
+	dapnet_log.notice('[dau_core]','starting dapnet_dau v%s ...'%version)
+	
+	# config file first - cli overrides it
+	for arg in argv:
+		if arg.startswith('--config='):
+			config_file = arg[9:]
+	config_mtime = dapnet_config.mtime(config_file)
+	config_values = dapnet_config.read(config_file, 'dapnet_dau', config_defaults)
+	if config_values:
+		dapnet_config.update(globals(), config_values)
+		dapnet_log.notice('[CONFIG]','loaded',config_file)
+	config_cli = {name: globals()[name] for name in config_defaults}
+	
+	if '--silent' in argv:
+		dapnet_log.debug('[dau_core]','running silent mode will set  debug = False')
+		silent = True
+		debug = False
+	
+	for arg in argv:
+		# override settings at cli e.g. --port=43435 --slots=2389D --socket=/tmp/dau.s --pipe= (empty disables pipe) --stats=0 --api=0 --spool= --config=./dapnet.conf --receiver
+		if arg.startswith('--port='):
+			tcp_port = int(arg[7:])
+		elif arg.startswith('--slots='):
+			client_slots = arg[8:]
+		elif arg.startswith('--socket='):
+			server_message_socket = arg[9:]
+			use_message_socket = bool(server_message_socket)
+		elif arg.startswith('--pipe='):
+			server_message_pipe = arg[7:]
+			use_message_pipe = bool(server_message_pipe)
+		elif arg.startswith('--stats='):
+			stats_port = int(arg[8:] or 0)
+		elif arg.startswith('--api='):
+			api_port = int(arg[6:] or 0)
+		elif arg.startswith('--spool='):
+			spool_dir = arg[8:]
+		elif arg == '--receiver':
+			use_receiver = True
+	
+	# settings given at cli are kept on reload
+	config_cli = {name for name, value in config_cli.items() if globals()[name] != value}
+	configure_log()
+	
+	return
+
+def slot_window(slots, now = None):
+	# start and end of the active or next run of consecutive slots (e.g. '2389D') - None without slots
+	
+	if now is None:
+		now = time.time()
+	active = {int(slot,16) for slot in slots}
+	if not active:
+		return None
+	
+	current = int(now * 10) // int(SLOT_TIME * 10)
+	for ahead in range(0,SLOT_COUNT):
+		if (current + ahead) % SLOT_COUNT in active:
+			break
+	first = last = current + ahead
+	while last + 1 - first < SLOT_COUNT and (last + 1) % SLOT_COUNT in active:
+		last += 1
+	
+	return first * SLOT_TIME, (last + 1) * SLOT_TIME
+
+def slot_wait(slots, now = None):
+	# seconds until one of slots begins - 0 if one is active now
+	
+	if now is None:
+		now = time.time()
+	window = slot_window(slots, now)
+	if window is None:
+		return 0
+	
+	return max(0, window[0] - now)
+
+def time_skyper (now = None):
+	now = datetime.datetime.utcfromtimestamp(time.time() if now is None else now)
 	time_string = now.strftime("%H%M%S %d%m%y")
 	# '5:1:9C8:0:%s'%time_string
 	return time_string
 
-def time_swissphone (localtime = False):
+def time_swissphone (localtime = False, now = None):
+	if now is None:
+		now = time.time()
 	if localtime:
-		now = datetime.datetime.now()
+		now = datetime.datetime.fromtimestamp(now)
 	else:
-		now = datetime.datetime.utcnow()
+		now = datetime.datetime.utcfromtimestamp(now)
 	time_string = now.strftime("%H%M%d%m%y")
 	# '6:1:287E0:3:XTIME=%sXTIME=%s'%(time_string,time_string)
 	return 'XTIME=%sXTIME=%s'%(time_string,time_string)
 
-def time_alphapoc(localtime = False):
+def time_alphapoc(localtime = False, now = None):
+	if now is None:
+		now = time.time()
 	if localtime:
-		now = datetime.datetime.now()
+		now = datetime.datetime.fromtimestamp(now)
 	else:
-		now = datetime.datetime.utcnow()
+		now = datetime.datetime.utcfromtimestamp(now)
 	time_string = now.strftime("%Y%m%d%H%M%S")
 	# '6:1:287EA:3:YYYYMMDDHHMMSS%s'%time_string
 	return 'YYYYMMDDHHMMSS%s'%time_string
 
-def make_message(m_type, m_speed, m_ric, m_function, message):
-	global last_msg, client_online, debug
+class Transmitter:
+	# one connected transmitter with its own handshake, timeslots, #XX counter and queue
 	
-	if client_online:
-		if last_msg >= 0xFF:
-			last_msg = 0
-		else:
-			last_msg += 1
-	else:
-		last_msg = 0
+	def __init__(self, reader, writer):
+		self.reader = reader
+		self.writer = writer
+		self.address = writer.get_extra_info('peername')
+		self.tag = '[CLIENT]'
+		self.online = True
+		self.callsign = None
+		self.slots = client_slots
+		self.last_msg = 0
+		self.beacon_job = None
+		self.handler = None					# task of handle_client
+		self.spool = None
+		self.connected = time.time()
+		
+		# replies of transmitter decoded from the stream - handshake and read_client take them from events
+		self.decoder = dapnet_proto.Decoder()
+		self.events = deque()
+		
+		# messages waiting for transmitter, one queue per priority - msg_event wakes up send_queue
+		# forwarded messages are served fair by their source
+		self.msg_queue = [deque(), deque(), dapnet_limit.FairQueue(fair_quantum, entry_airtime, lambda entry: entry[6])]
+		self.msg_event = asyncio.Event()
+		
+		# messages sent to transmitter waiting for ack
+		self.msg_pending = OrderedDict()	# '#XX' counter -> [data, sent, retries, queued, page, seq in spool, source]
+		self.data_pending = deque()			# [data, sent, retries, queued, None, None, source] of DATA acked in order by '+'
+		self.send_retries = deque()			# messages to be resent before msg_queue
+		self.pending_timer = None
+		
+		# timeslot window messages are released into - packed by airtime like the transmitter sends them
+		self.window = None
+		self.window_tx = pocsag.Transmission()
+		self.window_full = False
+		self.windows = 0
+		self.window_fill = 0				# sum of fill ratio of all windows
+		self.spilled = 0					# messages not fitting in window they were queued for
+		self.queued_airtime = 0				# airtime of queued messages waiting for a window
 	
-	return '#{:02X} {:1}:{}:{:x}:{:1}:{}'.format(last_msg,m_type,m_speed,m_ric,m_function,message)
-
-def send_data(data, wait_response = True, silent = False):
-	global client_conn, client_online, debug
+	def make_message(self, m_type, m_speed, m_ric, m_function, message):
+		# message without #XX counter - it is numbered by send_queue when it is sent first
+		
+		return '{:1}:{}:{:x}:{:1}:{}'.format(m_type,m_speed,m_ric,m_function,message)
 	
-	if client_online:
-		if not silent: print('[CLIENT]','MSG_SEND', data)
-		data += '\r\n'
-		try:
-			client_conn.sendall(data.encode("utf-8"))
-		except BrokenPipeError:
-			client_online = False
-			return False
+	def next_counter(self):
+		# next #XX counter not waiting for an ack - messages are sent in another order than queued,
+		# so a counter of 256 messages ago may still be in flight
+		
+		for i in range(0,0x100):
+			self.last_msg = (self.last_msg + 1) & 0xFF
+			counter = '{:02X}'.format(self.last_msg)
+			if counter not in self.msg_pending:
+				return counter
+		
+		return None
 	
-		if wait_response:
-			time.sleep(0.1)
-			client_conn.settimeout(2)
-			rec_data = client_conn.recv(1024).decode('utf-8')
-			client_conn.settimeout(None)
-			if rec_data:
-				msg_ack = MSG_ACK_PATTERN.match(rec_data)
-				if msg_ack:
-					if not silent: print('[CLIENT]','MSG_ACK',msg_ack[1])
-					return msg_ack[1]
-				elif rec_data.rstrip() == '+':
-					if not silent: print('[CLIENT]','DATA_ACK')
-					return True
-				else:
-					if not silent: print('[CLIENT]','received invalid response',rec_data)
-					return rec_data
+	def window_free(self):
+		# True if another message may be sent without waiting for an ack - at most 256 #XX counters
+		
+		return len(self.msg_pending) + len(self.data_pending) < min(send_window, 0x100)
+	
+	def set_slots(self, slots):
+		# new timeslots of running session - sent as DATA like in handshake
+		
+		if slots == self.slots:
+			return
+		
+		self.slots = slots
+		dapnet_log.info(self.tag,'SET_TIMESLOTS',self.slots)
+		self.queue_message(dapnet_proto.set_slots(self.slots), PRIO_DATA)
+		
+		# window of old timeslots is gone
+		self.window = None
+		self.window_tx = pocsag.Transmission()
+		self.window_full = False
+		return
+	
+	def queue_message(self, data, priority = PRIO_MSG, page = None, seq = None, queued = None, source = 'core'):
+		# put message in queue and wake up send_queue - returns expected seconds until it is released
+		# page (m_type, m_speed, m_ric, message) is used to pack messages by airtime, seq is its record in spool
+		
+		self.msg_queue[priority].append([data, 0, 0, queued or time.monotonic(), page, seq, source])
+		self.msg_event.set()
+		
+		if priority == PRIO_DATA:
+			return 0
+		if page is None:
+			return self.release_wait()
+		
+		delay = self.expected_delay()
+		self.queued_airtime += pocsag.packed_airtime(page[0], page[1], page[3])
+		return delay
+	
+	def expected_delay(self):
+		# seconds until a message queued now is released - windows ahead are filled by queued airtime
+		
+		now = time.time()
+		window = slot_window(self.slots, now)
+		if window is None:
+			return 0
+		
+		backlog = self.queued_airtime
+		if window == self.window:
+			backlog += self.window_tx.airtime
+		while backlog >= window[1] - window[0]:
+			backlog -= window[1] - window[0]
+			window = slot_window(self.slots, window[1] + 0.001)
+		
+		return max(0, window[0] - slot_lead - now)
+	
+	def queue_page(self, m_type, m_speed, m_ric, m_function, message, priority = PRIO_MSG, source = 'core'):
+		data = self.make_message(m_type,m_speed,m_ric,m_function,message)
+		
+		# forwarded messages are spooled - time messages and beacon are outdated after a reconnect
+		seq = None
+		if priority == PRIO_MSG and self.spool:
+			seq = self.spool.append((m_type, m_speed, m_ric, m_function, message))
+		
+		return self.queue_message(data, priority, (m_type, m_speed, m_ric, message), seq, source=source)
+	
+	def replay_spool(self):
+		# queue spooled messages of last connection in front of messages queued during handshake
+		
+		self.spool = spools.get(self.callsign.lower()) or open_spool(self.callsign)
+		if self.spool is None:
+			return
+		spools[self.callsign.lower()] = self.spool
+		
+		self.spool.expire()
+		queued = list(self.msg_queue[PRIO_MSG])
+		self.msg_queue[PRIO_MSG].clear()
+		self.queued_airtime = 0
+		now = time.time()
+		replayed = 0
+		spooled = set()
+		for seq, ts, (m_type, m_speed, m_ric, m_function, message) in self.spool.pending():
+			data = self.make_message(m_type,m_speed,m_ric,m_function,message)
+			self.queue_message(data, PRIO_MSG, (m_type, m_speed, m_ric, message), seq, time.monotonic() - max(0, now - ts), 'spool')
+			if ts >= self.connected:
+				spooled.add((m_type, m_speed, m_ric, message))
 			else:
-				if not silent: print('[CLIENT]','not answered - message dropped')
-				client_online = False
+				replayed += 1
+		for entry in queued:
+			# spooled already while callsign was not known
+			page = entry[4]
+			if page in spooled:
+				continue
+			seq = self.spool.append((page[0], page[1], page[2], int(entry[0].split(':')[3]), page[3]))
+			self.queue_message(entry[0], PRIO_MSG, page, seq, entry[3], entry[6])
+		
+		if replayed: dapnet_log.info(self.tag,'SPOOL replay',replayed,'messages')
+		return
+	
+	def spool_done(self, entry):
+		# message acked or finally dropped - it is not replayed after reconnect
+		
+		if entry[5] is not None and self.spool:
+			self.spool.done(entry[5])
+		return
+	
+	def next_entry(self):
+		# next message to send - messages wait for transmitters timeslot, DATA is sent at once
+		
+		if not self.window_free():
+			return None
+		if self.send_retries:
+			return self.send_retries.popleft()
+		if self.msg_queue[PRIO_DATA]:
+			return self.msg_queue[PRIO_DATA].popleft()
+		if self.release_wait() == 0:
+			for queue in self.msg_queue[PRIO_TIME:]:
+				while queue and queue[0][5] is not None and self.spool and queue[0][5] not in self.spool.live:
+					# expired in spool
+					entry = queue.popleft()
+					dapnet_log.debug(self.tag,'SPOOL expired',entry[0])
+					if entry[4] is not None:
+						self.queued_airtime = max(0, self.queued_airtime - pocsag.packed_airtime(entry[4][0], entry[4][1], entry[4][3]))
+				if queue and self.fits(queue[0]):
+					entry = queue.popleft()
+					queue_space.set()
+					if entry[4] is not None:
+						self.queued_airtime = max(0, self.queued_airtime - pocsag.packed_airtime(entry[4][0], entry[4][1], entry[4][3]))
+					return entry
+		return None
+	
+	def release_wait(self):
+		# seconds until queued messages may be released to transmitter
+		
+		now = time.time()
+		if self.window_full and self.window[1] > now:
+			return self.window[1] - now
+		
+		return max(0, slot_wait(self.slots, now) - slot_lead)
+	
+	def fits(self, entry):
+		# True if message fits in the airtime left in the timeslot window - it is accounted then
+		
+		page = entry[4]
+		window = slot_window(self.slots)
+		if page is None or window is None:
+			return True
+		
+		if window != self.window:
+			self.next_window(window)
+		if self.window_full:
+			return False
+		
+		now = time.time()
+		left = min(window[1] - window[0] - self.window_tx.airtime, window[1] - max(now, window[0]))
+		if self.window_tx.cost(*page) > left and (self.window_tx.messages or left < window[1] - window[0]):
+			# spill over into next window - message longer than a whole window is sent anyway
+			dapnet_log.debug(self.tag,'SLOT_WINDOW full - spill over',entry[0])
+			self.spilled += 1
+			stats_spilled.inc(transmitter=self.callsign)
+			self.window_full = True
+			return False
+		
+		self.window_tx.add(*page)
+		return True
+	
+	def next_window(self, window):
+		# account fill ratio of past window and start the next one
+		
+		if self.window is not None and self.window_tx.messages:
+			fill = self.window_tx.airtime / (self.window[1] - self.window[0])
+			self.windows += 1
+			self.window_fill += fill
+			stats_fill.observe(fill, transmitter=self.callsign)
+			dapnet_log.info(self.tag,'SLOT_WINDOW',self.window_tx.messages,'messages','fill {:.0%}'.format(fill),'spilled',self.spilled)
+		
+		self.window = window
+		self.window_tx = pocsag.Transmission()
+		self.window_full = False
+		return
+	
+	async def read_event(self, timeout = None):
+		# next reply of transmitter - (None, None) if connection is closed, TimeoutError if timeout is over
+		
+		while not self.events:
+			try:
+				data = await asyncio.wait_for(self.reader.read(4096), timeout)
+			except asyncio.TimeoutError:
+				# an OSError since python 3.11 - but no closed connection
+				raise
+			except OSError:
+				data = b''
+			if not data:
+				self.online = False
+				return None, None
+			self.events.extend(self.decoder.feed(data))
+		
+		return self.events.popleft()
+	
+	async def expect(self, expected, timeout):
+		# wait for reply of type expected - other replies are logged and skipped, TimeoutError if it does not come
+		
+		deadline = time.monotonic() + timeout
+		while True:
+			event, fields = await self.read_event(max(0, deadline - time.monotonic()))
+			if event is None or event == expected:
+				return fields
+			dapnet_log.info(self.tag,'received unexpected response',event,*fields)
+	
+	def send_line(self, data):
+		# write without waiting for drain - transmitter reads it at once in handshake
+		
+		dapnet_log.debug(self.tag,'DATA_SEND',data)
+		self.writer.write(dapnet_proto.encode(data))
+		return
+	
+	async def handshake(self):
+		# login, 4 rounds of time-sync, time correction and timeslots - each step as soon as transmitter answers
+		
+		start = time.monotonic()
+		login = await self.expect(dapnet_proto.LOGIN, handshake_timeout)
+		if not login:
+			dapnet_log.info(self.tag,'closed before login')
+			return False
+		
+		login_type, login_version, login_callsign, login_key = login
+		self.callsign = login_callsign
+		self.tag = '[CLIENT {}]'.format(login_callsign)
+		self.slots = client_slots_by_call.get(login_callsign, client_slots)
+		dapnet_log.info(self.tag,'LOGIN:',login_type,login_version,login_callsign,login_key)
+		phase_login = time.monotonic()
+		
+		# time_sync - transmitter answers each round with 2:XXXX:YYYY
+		for x in range(0,4):
+			dapnet_log.debug(self.tag,'TIME_SYNC',x)
+			sent = time.monotonic()
+			self.send_line(dapnet_proto.time_sync(x))
+			await self.writer.drain()
+			time_sync = await self.expect(dapnet_proto.TIME, handshake_timeout)
+			if not time_sync:
 				return False
+			dapnet_log.debug(self.tag,'TIME_SYNC',x,'received',time_sync[0],time_sync[1],'{:.1f}ms'.format((time.monotonic() - sent) * 1000))
+		phase_time = time.monotonic()
+		
+		# ack time_sync and send slots - both acked in order by +
+		dapnet_log.info(self.tag,'TIME_SYNC ACK')
+		self.send_line(dapnet_proto.time_ack())
+		dapnet_log.info(self.tag,'SET_TIMESLOTS',self.slots)
+		self.send_line(dapnet_proto.set_slots(self.slots))
+		await self.writer.drain()
+		for data in ('TIME_SYNC ACK', 'SET_TIMESLOTS'):
+			ack = await self.expect(dapnet_proto.DATA_ACK, handshake_timeout)
+			if not ack:
+				return False
+			if ack[0] != '+':
+				dapnet_log.info(self.tag,data,'rejected')
+		phase_slots = time.monotonic()
+		
+		stats_handshake_phase.observe(phase_login - start, phase='login')
+		stats_handshake_phase.observe(phase_time - phase_login, phase='time')
+		stats_handshake_phase.observe(phase_slots - phase_time, phase='slots')
+		dapnet_log.info(self.tag,'handshake done {:.1f}ms (login {:.1f}ms, time {:.1f}ms, slots {:.1f}ms)'.format((phase_slots - start) * 1000, (phase_login - start) * 1000, (phase_time - phase_login) * 1000, (phase_slots - phase_time) * 1000))
+		
+		return self.online
+	
+	async def send_queue(self):
+		dapnet_log.debug(self.tag,'QUEUE handler running')
+		
+		while running and self.online:
+			entry = self.next_entry()
+			if entry is None:
+				# window is full, nothing to send or timeslot is not near - wait for acks, new messages or timeslot
+				timeout = None
+				if self.window_free() and any(self.msg_queue[PRIO_TIME:]):
+					timeout = self.release_wait()
+				self.msg_event.clear()
+				try:
+					await asyncio.wait_for(self.msg_event.wait(), timeout)
+				except asyncio.TimeoutError:
+					pass
+				continue
+			
+			# messages (with page) are numbered once - a resent message keeps its counter
+			if entry[4] is not None:
+				m_type = 'MSG'
+				if entry[0][0] != '#':
+					entry[0] = '#{} {}'.format(self.next_counter(), entry[0])
+			else:
+				m_type = 'DATA'
+			data = entry[0]
+			dapnet_log.debug(self.tag,'message processing',data)
+			
+			entry[1] = time.monotonic()
+			if m_type == 'MSG':
+				dapnet_log.info(self.tag,'MSG_SEND', data, dapnet_log.Lazy('queued {:.1f}s',entry[1] - entry[3]))
+				if not entry[2]:
+					stats_messages_out.inc(transmitter=self.callsign)
+					stats_queue_delay.observe(entry[1] - entry[3], transmitter=self.callsign)
+			
+			if m_type == 'MSG':
+				self.msg_pending[data[1:3]] = entry
+			else:
+				self.data_pending.append(entry)
+			self.start_pending_timer()
+			
+			try:
+				self.writer.write((data + '\r\n').encode("utf-8"))
+				await self.writer.drain()
+			except OSError:
+				self.online = False
+				break
+		
+		if not self.online:
+			dapnet_log.info(self.tag,'client gone offline')
+		
+		dapnet_log.debug(self.tag,'QUEUE handler stopped')
+		return False
+	
+	async def read_client(self):
+		dapnet_log.debug(self.tag,'ACK handler running')
+		
+		while running and self.online:
+			event, fields = await self.read_event()
+			
+			if event is None:
+				dapnet_log.info(self.tag,'connection closed by transmitter')
+				break
+			
+			self.handle_response(event, fields)
+		
+		self.msg_event.set()
+		
+		dapnet_log.debug(self.tag,'ACK handler stopped')
+		return False
+	
+	def handle_response(self, event, fields):
+		now = time.monotonic()
+		
+		if event == dapnet_proto.MSG_ACK:
+			counter, result = fields
+			entry = self.msg_pending.pop(counter, None)
+			if entry is None:
+				dapnet_log.debug(self.tag,'MSG_ACK for unknown message',counter)
+			elif result == '+':
+				dapnet_log.info(self.tag,'MSG_ACK',counter,dapnet_log.Lazy('{:.1f}ms',(now - entry[1]) * 1000))
+				stats_responses.inc(transmitter=self.callsign, result='ack')
+				stats_ack_latency.observe(now - entry[1], transmitter=self.callsign)
+				self.spool_done(entry)
+			elif result == '%':
+				stats_responses.inc(transmitter=self.callsign, result='retry')
+				self.retry_message(entry,'MSG_RETRY')
+			else:
+				dapnet_log.info(self.tag,'MSG_NAK',counter,'- message dropped')
+				stats_responses.inc(transmitter=self.callsign, result='nak')
+				self.spool_done(entry)
+		elif event == dapnet_proto.DATA_ACK and self.data_pending:
+			entry = self.data_pending.popleft()
+			if fields[0] == '+':
+				dapnet_log.debug(self.tag,'DATA_ACK',entry[0],dapnet_log.Lazy('{:.1f}ms',(now - entry[1]) * 1000))
+			else:
+				dapnet_log.info(self.tag,'DATA_NAK',entry[0])
 		else:
+			dapnet_log.info(self.tag,'received invalid response',event,*fields)
+		
+		self.msg_event.set()
+		return
+	
+	def retry_message(self, entry, reason):
+		# requeue message (with same counter) in front of msg_queue
+		
+		if entry[2] < send_retry:
+			entry[2] += 1
+			dapnet_log.info(self.tag,reason,entry[0],'- resend',entry[2])
+			self.send_retries.append(entry)
+		else:
+			dapnet_log.info(self.tag,reason,entry[0],'- message dropped')
+			stats_responses.inc(transmitter=self.callsign, result='dropped')
+			self.spool_done(entry)
+		
+		return
+	
+	def pending_timeout(self):
+		# seconds until the oldest sent message times out - None if nothing is pending
+		
+		sent = [entry[1] for entry in (next(iter(self.msg_pending.values()), None), self.data_pending[0] if self.data_pending else None) if entry]
+		if not sent:
+			return None
+		
+		return max(0, min(sent) + send_timeout - time.monotonic())
+	
+	def start_pending_timer(self):
+		# timer only runs while messages are waiting for ack
+		
+		if self.pending_timer is None and self.online:
+			timeout = self.pending_timeout()
+			if timeout is not None:
+				self.pending_timer = asyncio.get_running_loop().call_later(timeout, self.check_pending)
+		
+		return
+	
+	def check_pending(self):
+		# walk through sent messages and resend or drop them on timeout
+		
+		self.pending_timer = None
+		now = time.monotonic()
+		for counter, entry in list(self.msg_pending.items()):
+			if entry[1] + send_timeout > now:
+				break
+			self.msg_pending.pop(counter)
+			stats_responses.inc(transmitter=self.callsign, result='timeout')
+			self.retry_message(entry,'MSG_TIMEOUT')
+		
+		while self.data_pending and self.data_pending[0][1] + send_timeout <= now:
+			entry = self.data_pending.popleft()
+			dapnet_log.info(self.tag,'not answered - DATA dropped',entry[0])
+		
+		self.start_pending_timer()
+		self.msg_event.set()
+		return
+	
+	def send_beacon(self, due = None):
+		if self.online:
+			dapnet_log.info(self.tag,'BEACON',client_callsign)
+			self.queue_page(6,1,8,3,client_callsign,PRIO_TIME)
+		return
+	
+	def close(self):
+		self.online = False
+		if self.beacon_job:
+			scheduler.remove(self.beacon_job)
+			self.beacon_job = None
+		if self.pending_timer:
+			self.pending_timer.cancel()
+			self.pending_timer = None
+		self.msg_event.set()
+		self.writer.close()
+		return
+
+def entry_airtime(entry):
+	# airtime of a queued message - cost of the fair queue
+	
+	page = entry[4]
+	if page is None:
+		return 0
+	
+	return pocsag.packed_airtime(page[0], page[1], page[3])
+
+def queue_message(m_type, m_speed, m_ric, m_function, message, priority = PRIO_MSG, source = 'core'):
+	# fan out message to all online transmitters - each will number it with its own counter
+	# returns the longest expected queuing delay - None if no transmitter is connected (message may be spooled)
+	
+	delay = None
+	online = set()
+	for tx in transmitters:
+		if tx.online:
+			tx_delay = tx.queue_page(m_type,m_speed,m_ric,m_function,message,priority,source)
+			delay = max(delay or 0, tx_delay)
+			if tx.callsign: online.add(tx.callsign.lower())
+	
+	# known transmitters get the message on reconnect
+	if priority == PRIO_MSG:
+		for callsign, spool in spools.items():
+			if callsign not in online:
+				spool.append((m_type, m_speed, m_ric, m_function, message))
+	
+	if delay is None: dapnet_log.debug('[dau_core]','no transmitter connected - message dropped')
+	return delay
+
+def queue_data(data):
+	# fan out DATA (e.g. 3:+0000) to all online transmitters
+	
+	for tx in transmitters:
+		if tx.online:
+			tx.queue_message(data, PRIO_DATA)
+	
+	return
+
+def queue_full():
+	# True if a transmitter has msg_queue_max messages waiting
+	
+	for tx in transmitters:
+		if tx.online and len(tx.msg_queue[PRIO_MSG]) >= msg_queue_max:
 			return True
-	else:
-		if not silent: print('[CLIENT]','not connected - message dropped')
-		client_online = False
-		return False
+	
+	return False
 
-def send_queue():
-	global running, client_conn, client_online, msg_queue, debug
+async def wait_queue_space(timeout = None):
+	# wait until no transmitter queue is full - False on timeout
 	
-	if debug: print('[QUEUE]','handler running')
+	deadline = None if timeout is None else time.monotonic() + timeout
+	while running and queue_full():
+		queue_space.clear()
+		try:
+			await asyncio.wait_for(queue_space.wait(), None if deadline is None else max(0, deadline - time.monotonic()))
+		except asyncio.TimeoutError:
+			return False
 	
-	while running and client_online:
-		if not msg_queue.empty():
-			if debug: print('[QUEUE]','message waiting')
-			while client_online and not msg_queue.empty():
-				data = msg_queue.get()
-				if debug: print('[QUEUE]','message processing',data)
-				
-				if data[0] == '#':
-					m_type = 'MSG'
-				else:
-					m_type = 'DATA'
-				
-				if m_type == 'MSG': 
-					if not silent: print('[CLIENT]','{}_SEND'.format(m_type), data)
-				data += '\r\n'
+	return True
+
+def configure_budgets():
+	source_budget.configure(limit_source_rate, limit_source_burst, limit_source_airtime, limit_source_airtime_burst)
+	ric_budget.configure(limit_ric_rate, limit_ric_burst, limit_ric_airtime, limit_ric_airtime_burst)
+	return
+
+async def wait_budget(tag, m_type, m_speed, message, timeout = None):
+	# wait until message is in budget of its source - False on timeout
+	
+	source = tag.strip('[]').lower()
+	airtime = pocsag.packed_airtime(m_type, m_speed, message)
+	wait = source_budget.wait(source, airtime)
+	if not wait:
+		return True
+	
+	dapnet_log.debug(tag,'over budget - wait',dapnet_log.Lazy('{:.1f}s',wait))
+	stats_throttled.inc(source=source)
+	start = time.monotonic()
+	deadline = None if timeout is None else start + timeout
+	while running and wait:
+		if deadline is not None and time.monotonic() + wait > deadline:
+			stats_throttle_wait.observe(time.monotonic() - start, source=source)
+			return False
+		await asyncio.sleep(wait)
+		wait = source_budget.wait(source, airtime)
+	stats_throttle_wait.observe(time.monotonic() - start, source=source)
+	
+	return True
+
+def submit_message(tag, m_type, m_speed, m_ric, m_function, message):
+	# check message in history once for all transmitters and queue it
+	# returns queued, spooled (only offline transmitters), duplicate, offline (no transmitter known), full or limited
+	
+	dapnet_log.info(tag,'MSG:',m_type,m_speed,m_ric,m_function,message)
+	source = tag.strip('[]').lower()
+	stats_messages_in.inc(source=source)
+	if not spools and not any(tx.online for tx in transmitters):
+		dapnet_log.info(tag, 'no transmitter connected - dropped')
+		return 'offline'
+	if queue_full():
+		dapnet_log.info(tag, 'queue full - dropped')
+		return 'full'
+	
+	# pagers of ric may receive it faster
+	fastest = ric_speed.get(m_ric, speed_upgrade)
+	if fastest in pocsag.BAUD and fastest > m_speed:
+		dapnet_log.debug(tag, 'speed',pocsag.BAUD[m_speed],'->',pocsag.BAUD[fastest])
+		stats_upgraded.inc(speed=pocsag.BAUD[fastest])
+		m_speed = fastest
+	
+	# budgets are checked before history - a message dropped here may come again
+	airtime = pocsag.packed_airtime(m_type, m_speed, message)
+	for limit, budget, key in (('source', source_budget, source), ('ric', ric_budget, m_ric)):
+		if budget.wait(key, airtime):
+			dapnet_log.info(tag, 'over budget of',limit,key,'- dropped')
+			stats_limited.inc(source=source, limit=limit)
+			return 'limited'
+	
+	m_send = check_history(m_ric,message)
+	dapnet_log.debug(tag, 'check MSG in history - send: ',m_send)
+	if not m_send:
+		dapnet_log.info(tag, 'MSG in blocktime - dropped',m_send)
+		stats_history_hits.inc()
+		return 'duplicate'
+	
+	source_budget.take(source, airtime)
+	ric_budget.take(m_ric, airtime)
+	delay = queue_message(m_type,m_speed,m_ric,m_function,message,PRIO_MSG,source)
+	if delay is None:
+		dapnet_log.info(tag,'MSG spooled - no transmitter connected')
+		return 'spooled'
+	
+	dapnet_log.info(tag,'MSG queued - expected delay',dapnet_log.Lazy('{:.1f}s',delay))
+	return 'queued'
+
+def parse_received(tag, data):
+	# (m_type, m_speed, m_ric, m_function, message) of message received by SOCK or PIPE - None if invalid
+	
+	msg_data = MSG_PATTERN.match(data)
+	if not msg_data or int(msg_data[2]) not in pocsag.BAUD:
+		dapnet_log.info(tag,'received invalid message',data)
+		stats_invalid.inc(source=tag.strip('[]').lower())
+		return None
+	
+	return int(msg_data[1]), int(msg_data[2]), int(msg_data[3]), int(msg_data[4]), msg_data[5].rstrip('\r\n')
+
+async def queue_received(tag, data):
+	# parse message received by SOCK or PIPE and queue it - waits for queue space and budget of source
+	# returns result of submit_message or invalid
+	
+	message = parse_received(tag, data)
+	if message is None:
+		return 'invalid'
+	
+	return await submit_waiting(tag,*message)
+
+async def submit_waiting(tag, m_type, m_speed, m_ric, m_function, message):
+	# backpressure - reader of tag stops while queue is full or its source is over budget
+	
+	await wait_queue_space()
+	await wait_budget(tag, m_type, m_speed, message)
+	
+	return submit_message(tag, m_type, m_speed, m_ric, m_function, message)
+
+def submit_threadsafe(tag, m_type, m_speed, m_ric, m_function, message, timeout = None):
+	# submit message from another thread of this process (receiver, program using Core) - blocks like submit_waiting
+	# returns result of submit_message, offline if core is not running or full on timeout
+	
+	if m_speed not in pocsag.BAUD:
+		raise ValueError('invalid speed {}'.format(m_speed))
+	if not running or core_loop is None:
+		return 'offline'
+	
+	try:
+		future = asyncio.run_coroutine_threadsafe(submit_waiting(tag, m_type, m_speed, m_ric, m_function, message), core_loop)
+	except RuntimeError:
+		# loop is already closed
+		return 'offline'
+	try:
+		return future.result(timeout)
+	except concurrent.futures.TimeoutError:
+		future.cancel()
+		return 'full'
+
+def deliver_received(msg_data, received):
+	# messages decoded by the receiver in this process - called in its input threads
+	# up to receiver_window messages are handed over without waiting for their result, the receiver waits
+	# only if the core does not keep up (queue full or source over budget)
+	
+	if not running or core_loop is None:
+		raise RuntimeError('core is not running')
+	
+	receiver_pending.acquire()
+	try:
+		future = asyncio.run_coroutine_threadsafe(submit_waiting('[RECEIVER]', *msg_data), core_loop)
+	except RuntimeError:
+		receiver_pending.release()
+		raise
+	future.add_done_callback(lambda future: receiver_pending.release())
+	
+	return
+
+def parse_api_message(item):
+	# message of api as dict with type, speed, ric, function, text or as string type:speed:ric:function:text
+	
+	if isinstance(item, str):
+		msg_data = MSG_PATTERN.match(item)
+		if not msg_data:
+			return None
+		item = {'type': msg_data[1], 'speed': msg_data[2], 'ric': msg_data[3], 'function': msg_data[4], 'text': msg_data[5]}
+	
+	try:
+		m_type = int(item.get('type', pocsag.TYPE_ALPHA))
+		m_speed = int(item.get('speed', 1))
+		m_ric = int(item['ric'])
+		m_function = int(item.get('function', 3))
+		message = str(item.get('text', ''))
+	except (AttributeError, KeyError, TypeError, ValueError):
+		return None
+	
+	if m_type not in (pocsag.TYPE_NUMERIC, pocsag.TYPE_ALPHA) or m_speed not in pocsag.BAUD:
+		return None
+	if not 0 <= m_function <= 3 or not 0 <= m_ric < 2**21 or '\n' in message or '\r' in message:
+		return None
+	
+	# json may carry lone surrogates - they can not be sent to a transmitter
+	try:
+		message.encode('utf-8')
+	except UnicodeEncodeError:
+		return None
+	
+	return m_type, m_speed, m_ric, m_function, message
+
+async def api_response(writer, status, result, headers = ()):
+	reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 429: 'Too Many Requests', 503: 'Service Unavailable'}[status]
+	body = json.dumps(result).encode('utf-8')
+	head = ['HTTP/1.1 {} {}'.format(status, reason), 'Content-Type: application/json', 'Content-Length: {}'.format(len(body)), 'Connection: close']
+	head.extend(headers)
+	writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+	try:
+		await writer.drain()
+	except OSError:
+		pass
+	
+	return
+
+async def handle_api(reader, writer):
+	# POST /messages with {"messages": [...]} or a list of messages - every message gets its own result
+	
+	try:
+		request = (await asyncio.wait_for(reader.readline(), 10)).decode('latin-1').split()
+		headers = {}
+		while True:
+			line = await asyncio.wait_for(reader.readline(), 10)
+			if line in (b'\r\n', b'\n', b''):
+				break
+			name, _, value = line.decode('latin-1').partition(':')
+			headers[name.strip().lower()] = value.strip()
+		body = await asyncio.wait_for(reader.readexactly(int(headers.get('content-length', 0))), 10)
+	except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, OSError):
+		writer.close()
+		return
+	
+	if len(request) < 2 or request[1].split('?')[0] not in ('/', '/messages'):
+		await api_response(writer, 404, {'error': 'not found'})
+	elif request[0] != 'POST':
+		await api_response(writer, 405, {'error': 'use POST'})
+	else:
+		try:
+			data = json.loads(body.decode('utf-8'))
+			if isinstance(data, dict):
+				data = data['messages']
+			if not isinstance(data, list):
+				raise ValueError
+		except (ValueError, KeyError, UnicodeDecodeError):
+			data = None
+		
+		if data is None:
+			await api_response(writer, 400, {'error': 'expected {"messages": [...]}'})
+		else:
+			dapnet_log.debug('[API]','received',len(data),'messages')
+			results = []
+			for item in data:
+				message = parse_api_message(item)
+				if message is None:
+					dapnet_log.info('[API]','received invalid message',item)
+					stats_invalid.inc(source='api')
+					results.append('invalid')
+					continue
+				# backpressure - wait for transmitters to take messages from queue and for budget of api
+				await wait_queue_space(api_wait)
+				if not await wait_budget('[API]', message[0], message[1], message[4], api_wait):
+					dapnet_log.info('[API]','over budget - dropped',message[2])
+					stats_limited.inc(source='api', limit='source')
+					results.append('limited')
+					continue
+				# one failing message must not cost the results of the others
 				try:
-					client_conn.sendall(data.encode("utf-8"))
-				except BrokenPipeError:
-					client_online = False
-					break
+					results.append(submit_message('[API]',*message))
+				except Exception as e:
+					dapnet_log.error('[API]','ERROR:',message[2],repr(e))
+					results.append('error')
 			
-				# wait for response
-				time.sleep(0.1)
-				client_conn.settimeout(2)
-				rec_data = client_conn.recv(1024).decode('utf-8')
-				client_conn.settimeout(None)
-
-				is_ack = False
-				if rec_data:
-					if m_type == 'MSG':
-						msg_ack = MSG_ACK_PATTERN.match(rec_data)
-						if msg_ack: is_ack = True
-					elif m_type == 'DATA':
-						if rec_data.rstrip() == '+': is_ack = True
-					
-					if is_ack:
-						if m_type == 'MSG' and debug: print('[CLIENT]','{}_ACK'.format(m_type))
-					else:
-						if not silent: print('[CLIENT]','{}_NAK : invalid response'.format(m_type),rec_data)
-					
-					continue
-				else:
-					if not silent: print('[CLIENT]','not answered - {} dropped'.format(m_type))
-					client_online = False
-					break
-
-				time.sleep(0.1)
+			summary = {result: results.count(result) for result in set(results)}
+			if 'full' in results:
+				await api_response(writer, 503, {'results': results, 'summary': summary}, ['Retry-After: {}'.format(api_wait)])
+			elif 'limited' in results:
+				await api_response(writer, 429, {'results': results, 'summary': summary}, ['Retry-After: {}'.format(api_wait)])
+			else:
+				await api_response(writer, 200, {'results': results, 'summary': summary})
+	
+	writer.close()
+	return
 
-			if not client_online:
-				if not silent: print('[QUEUE]','client gone offline')
+async def handle_client(reader, writer):
+	global running
+	
+	if not running or len(transmitters) >= client_max:
+		dapnet_log.info('[CLIENT]','refused',writer.get_extra_info('peername'),'- client_max reached')
+		writer.close()
+		return
+	
+	tx = Transmitter(reader, writer)
+	tx.handler = asyncio.current_task()
+	dapnet_log.notice(tx.tag,'connected',tx.address)
+	transmitters.append(tx)
+	stats_connections.inc()
+	
+	try:
+		start = time.monotonic()
+		if await tx.handshake():
+			stats_handshake.observe(time.monotonic() - start)
+			tx.replay_spool()
+			# main-queue
+			dapnet_log.info(tx.tag,'init client loop')
 			
-			if client_online and debug: print('[QUEUE]','no data')
-		
-		time.sleep(0.1)
+			tx.send_beacon()
+			tx.beacon_job = scheduler.every('beacon', beacon_interval, tx.send_beacon)
+			
+			# sending and reading end together - if one of them fails, the other one is cancelled
+			tasks = [asyncio.ensure_future(tx.send_queue()), asyncio.ensure_future(tx.read_client())]
+			try:
+				done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+			finally:
+				for task in tasks:
+					task.cancel()
+				await asyncio.gather(*tasks, return_exceptions=True)
+			for task in done:
+				task.result()
+	except (asyncio.TimeoutError, OSError) as e:
+		dapnet_log.info(tx.tag,'handshake failed',repr(e))
+	except Exception as e:
+		dapnet_log.error(tx.tag,'ERROR:',repr(e))
+	finally:
+		# a transmitter left in transmitters would count for client_max and queue_full for ever
+		transmitters.remove(tx)
+		tx.close()
+		dapnet_log.notice(tx.tag,'disconnected',tx.address)
 	
-	if debug: print('[QUEUE]','handler stopped')
-	return False
+	return
 
-def read_pipe():
-	global running, server_message_pipe, msq_queue, debug
+async def read_pipe():
+	global running, server_message_pipe
 	
 	try:
 		os.mkfifo(server_message_pipe)
-		if not silent: print('[PIPE]','ready')
+		dapnet_log.info('[PIPE]','ready')
 	except OSError as e:
 		if e.errno == 17:
-			if debug: print('[PIPE]','named-pipe already there ...')
+			dapnet_log.debug('[PIPE]','named-pipe already there ...')
 		else:
-			print('[PIPE]',server_message_pipe,'ERROR:',e.errno)
-
-	while running:
-		with open(server_message_pipe) as fifo:
-			while running:
-				data = fifo.readline()
-				if len(data) == 0:
-					if debug: print('[PIPE]','probably closed ...')
-					fifo.close()
-					break
-				if debug: print('[PIPE]','DATA:',data)
-				
-				if data:
-					msg_data = MSG_PATTERN.match(data)
-					if msg_data:
-						m_type = int(msg_data[1])
-						m_speed = int(msg_data[2])
-						m_ric = int(msg_data[3])
-						m_function = int(msg_data[4])
-						message = msg_data[5]
-						if not silent: print('[PIPE]','MSG:',m_type,m_speed,m_ric,m_function,message)
-						m_send = check_history(m_ric,message)
-						if debug: print('[PIPE]', 'check MSG in history - send: ',m_send)
-						if m_send:
-							msg_queue.put(make_message(m_type,m_speed,m_ric,m_function,message))
-						else: 
-							if not silent: print('[PIPE]', 'MSG in blocktime - dropped',m_send)
-					else:
-						if not silent: print('[PIPE]','received invalid message',data)
-				else:
-					if debug: print('pipe no data')
-		if debug: print('[PIPE]','closed!')
+			dapnet_log.error('[PIPE]',server_message_pipe,'ERROR:',e.errno)
+	
+	# keep own writer open - so reader will not see EOF whenever a client closes the pipe
+	fifo = open(os.open(server_message_pipe, os.O_RDONLY | os.O_NONBLOCK), 'rb', buffering=0)
+	fifo_keep = os.open(server_message_pipe, os.O_WRONLY | os.O_NONBLOCK)
+	
+	reader = asyncio.StreamReader()
+	transport, protocol = await asyncio.get_running_loop().connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), fifo)
+	
+	try:
+		while running:
+			try:
+				data = (await reader.readline()).decode('utf-8', 'replace')
+			except (ValueError, asyncio.LimitOverrunError) as e:
+				# line longer than the limit of reader - it is dropped, the pipe is read on
+				dapnet_log.error('[PIPE]','ERROR: line dropped -',e)
+				stats_invalid.inc(source='pipe')
+				continue
+			if len(data) == 0:
+				dapnet_log.debug('[PIPE]','probably closed ...')
+				break
+			dapnet_log.debug('[PIPE]','DATA:',data)
+			
+			if data.strip():
+				await queue_received('[PIPE]',data)
+			else:
+				dapnet_log.debug('pipe no data')
+	finally:
+		transport.close()
+		os.close(fifo_keep)
+		dapnet_log.debug('[PIPE]','closed!')
 	
 	return False
 
-def read_socket():
-	global running, server_message_socket, msg_queue, debug
+async def handle_socket(reader, writer):
+	global running
 	
-	if os.path.exists(server_message_socket):
-		os.remove(server_message_socket)
-
-	unix_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-	unix_socket.bind(server_message_socket)
-	if not silent: print('[SOCK]','ready')
-	unix_socket.listen(1)
-	while running:
-		unix_socket.settimeout(3)
-		try:
-			unix_socket_conn, addr = unix_socket.accept()
-		except socket.timeout:
-			continue
-		except:
-			raise
-		unix_socket.settimeout(None)
-		if debug: print('[SOCK]','connect',addr)
+	# messages are framed by newline - every complete line in buffer is parsed and acked,
+	# partial lines are kept for the next read - up to dapnet_proto.LINE_MAX, longer lines are dropped
+	
+	dapnet_log.debug('[SOCK]','connect')
+	buffer = b''
+	framed = False
+	overlong = False		# dropping rest of a line longer than LINE_MAX
+	sock_clients[writer] = asyncio.current_task()
+	try:
 		while running:
+			flushed = False
 			try:
-				unix_socket_conn.settimeout(2)
-				data = unix_socket_conn.recv(1024).decode('utf-8')
-				unix_socket_conn.settimeout(None)
-				if data:
-					if debug: print('[SOCK]','received data',data)
-					msg_data = MSG_PATTERN.match(data)
-					
-					if msg_data:
-						m_type = int(msg_data[1])
-						m_speed = int(msg_data[2])
-						m_ric = int(msg_data[3])
-						m_function = int(msg_data[4])
-						message = msg_data[5]
-						if not silent: print('[SOCK]','MSG:',m_type,m_speed,m_ric,m_function,message)
-						m_send = check_history(m_ric,message)
-						if debug: print('[SOCK]', 'check MSG in history - send: ',m_send)
-						if m_send:
-							msg_queue.put(make_message(m_type,m_speed,m_ric,m_function,message))
-						else: 
-							if not silent: print('[SOCK]', 'MSG in blocktime - dropped',m_send)
-					else:
-						if not silent: print('[SOCK]','received invalid message',data)
-					
-					if debug: print('[SOCK]','MSG ACK')
-					unix_socket_conn.sendall('+\r\n'.encode('utf-8'))
+				if (buffer or overlong) and not framed:
+					# legacy clients send one message without newline and wait for its ack - flushed after sock_flush_timeout
+					data = await asyncio.wait_for(reader.read(4096), sock_flush_timeout)
 				else:
-					if debug: print('[SOCK]','close')
-					unix_socket_conn.close()
-			except:
+					data = await reader.read(4096)
+			except asyncio.TimeoutError:
+				data = b'\n'
+				flushed = True
+			except OSError:
+				# connection lost
+				data = b''
+			
+			if not data:
+				dapnet_log.debug('[SOCK]','close')
 				break
-			time.sleep(1)
-		
-		time.sleep(1)
+			
+			buffer += data
+			lines = buffer.split(b'\n')
+			buffer = lines.pop()
+			if lines and not flushed:
+				framed = True
+			
+			acks = 0
+			for line in lines:
+				if overlong:
+					# end of dropped line - acked like invalid messages
+					overlong = False
+					acks += 1
+					continue
+				if len(line) > dapnet_proto.LINE_MAX:
+					dapnet_log.error('[SOCK]','ERROR: line dropped -',len(line),'bytes')
+					stats_invalid.inc(source='sock')
+					acks += 1
+					continue
+				line = line.decode('utf-8', 'replace').strip()
+				if line:
+					dapnet_log.debug('[SOCK]','received data',line)
+					await queue_received('[SOCK]',line)
+					acks += 1
+			
+			if len(buffer) > dapnet_proto.LINE_MAX:
+				if not overlong:
+					dapnet_log.error('[SOCK]','ERROR: line dropped - longer than',dapnet_proto.LINE_MAX,'bytes')
+					stats_invalid.inc(source='sock')
+				buffer = b''
+				overlong = True
+			
+			if acks:
+				# one ack per message - written as one batch
+				dapnet_log.debug('[SOCK]','MSG ACK',acks)
+				writer.write(b'+\r\n' * acks)
+				try:
+					await writer.drain()
+				except OSError:
+					break
+	finally:
+		# also when cancelled - the cancel goes on to the caller
+		del sock_clients[writer]
+		writer.close()
 	
-	unix_socket.shutdown(socket.SHUT_RDWR)
-	unix_socket.close()
 	return False
+
+def send_ping(due):
+	# resend 3:+0000 every core_ping seconds to check client-conn
+	
+	queue_data(dapnet_proto.time_ack())
+	return
+
+def send_time(due):
+	# time-messages on the full minute - due is the minute they are for
+	
+	if not transmitters:
+		return
+	
+	if (datetime.datetime.fromtimestamp(due).minute % 2) == 0:
+		if send_time_utc:
+			#gerade minute = UTC
+			dapnet_log.debug('[CLIENT]','SKYPER_TIME')
+			queue_message(5,1,2504,0,time_skyper(due), PRIO_TIME)
+			dapnet_log.debug('[CLIENT]','SWISSPHONE_TIME')
+			queue_message(6,1,208,3,time_swissphone(False,due), PRIO_TIME)
+			dapnet_log.debug('[CLIENT]','ALPHAPOC_TIME')
+			queue_message(6,1,224,3,time_alphapoc(False,due), PRIO_TIME)
+	elif send_time_local:
+		#ungerade minute = Lokalzeiten
+		dapnet_log.debug('[CLIENT]','SWISSPHONE_LOCALTIME')
+		queue_message(6,1,200,3,time_swissphone(True,due), PRIO_TIME)
+		dapnet_log.debug('[CLIENT]','ALPHAPOC_LOCALTIME')
+		queue_message(6,1,216,3,time_alphapoc(True,due), PRIO_TIME)
+	
+	return
+
+def expire_spools(due):
+	#expire spooled messages
+	
+	for callsign, spool in spools.items():
+		expired = spool.expire()
+		if expired: dapnet_log.info('[SPOOL]',callsign,'expired',expired,'messages')
+	
+	return
+
+def flush_spools(due):
+	# writes to spool are buffered - push them to disk every second
+	
+	for spool in spools.values():
+		spool.flush()
+	
+	return
+
+def start_timers():
+	global scheduler
+	
+	# periodic jobs - beacons are started per transmitter after handshake
+	scheduler = dapnet_timer.Scheduler(lateness=stats_timer_late, jitter=stats_timer_jitter)
+	timer_jobs['spool'] = scheduler.every('spool', 1, flush_spools)
+	timer_jobs['ping'] = scheduler.every('ping', core_ping, send_ping)
+	timer_jobs['time'] = scheduler.every('time', 60, send_time, align=True)
+	timer_jobs['history'] = scheduler.every('history', 60, lambda due: clean_history())
+	timer_jobs['expire'] = scheduler.every('expire', 60, expire_spools)
+	timer_jobs['config'] = scheduler.every('config', config_check, check_config)
+	return
+
+def open_spool(callsign):
+	# spool of transmitter - None if spool is disabled or not writable
+	
+	if not spool_dir:
+		return None
+	
+	try:
+		return dapnet_spool.Spool(os.path.join(spool_dir, callsign.lower()), spool_ttl, spool_segment_max, spool_max)
+	except OSError as e:
+		dapnet_log.error('[SPOOL]',callsign,'ERROR:',e)
+		return None
+
+def load_spools():
+	# spools of transmitters known from last run - their messages are kept until they reconnect
+	
+	if not spool_dir or not os.path.isdir(spool_dir):
+		return
+	
+	for name in sorted(os.listdir(spool_dir)):
+		if os.path.isdir(os.path.join(spool_dir, name)):
+			spool = open_spool(name)
+			if spool:
+				spools[name] = spool
+				dapnet_log.info('[SPOOL]',name,'messages',len(spool.live))
+	
+	return
+
+async def start_socket():
+	global sock_server, sock_path
+	
+	if not use_message_socket:
+		return
+	
+	dapnet_log.debug('[dau_core]','init SOCK ...')
+	if os.path.exists(server_message_socket):
+		os.remove(server_message_socket)
+	sock_server = await asyncio.start_unix_server(handle_socket, server_message_socket)
+	sock_path = server_message_socket
+	dapnet_log.info('[SOCK]','ready',sock_path)
+	return
+
+def stop_socket():
+	global sock_server, sock_path
+	
+	if sock_server:
+		sock_server.close()
+		try:
+			os.remove(sock_path)
+		except OSError:
+			pass
+	sock_server = None
+	sock_path = None
+	return
+
+async def start_api():
+	global api_server
+	
+	if not api_port:
+		return
+	
+	try:
+		api_server = await asyncio.start_server(handle_api, api_address, api_port)
+		dapnet_log.info('[API]','listen',api_address,api_port)
+	except OSError as e:
+		dapnet_log.error('[API]','ERROR:',e)
+	return
+
+def stop_api():
+	global api_server
+	
+	if api_server:
+		api_server.close()
+	api_server = None
+	return
+
+async def restart_listeners(socket, api):
+	# move SOCK or API to new address - connected transmitters are not touched
+	
+	if socket:
+		stop_socket()
+		await start_socket()
+	if api:
+		stop_api()
+		await start_api()
+	return
+
+def reload_config():
+	global config_mtime
+	
+	# read config_file again and apply changed settings to the running core
+	config_mtime = dapnet_config.mtime(config_file)
+	values = dapnet_config.read(config_file, 'dapnet_dau', config_defaults, config_cli)
+	if values is None:
+		dapnet_log.notice('[CONFIG]',config_file,'not found')
+		return
+	
+	changed = set(dapnet_config.update(globals(), values))
+	dapnet_log.info('[CONFIG]','reloaded',config_file,'- changed',', '.join(sorted(changed)) or 'nothing')
+	
+	for name in changed.intersection(config_restart):
+		dapnet_log.notice('[CONFIG]',name,'is applied on restart')
+	
+	if changed & {'debug', 'silent', 'log_level', 'log_levels', 'log_json', 'log_buffer'}:
+		configure_log()
+	
+	if changed & {'client_slots', 'client_slots_by_call'}:
+		for tx in transmitters:
+			if tx.callsign:
+				tx.set_slots(client_slots_by_call.get(tx.callsign, client_slots))
+	
+	if changed & {'msg_blocktime', 'msg_history_max'}:
+		clean_history()
+	
+	if any(name.startswith('limit_') for name in changed):
+		configure_budgets()
+	
+	if 'fair_quantum' in changed:
+		for tx in transmitters:
+			tx.msg_queue[PRIO_MSG].quantum = fair_quantum
+	
+	if changed & {'spool_ttl', 'spool_max', 'spool_segment_max'}:
+		for spool in spools.values():
+			spool.ttl = spool_ttl
+			spool.max_entries = spool_max
+			spool.segment_max = spool_segment_max
 	
+	socket = bool(changed & {'server_message_socket', 'use_message_socket'})
+	api = bool(changed & {'api_address', 'api_port'})
+	if socket or api:
+		asyncio.get_running_loop().create_task(restart_listeners(socket, api))
+	
+	if 'core_ping' in changed:
+		timer_jobs['ping'].set_interval(core_ping)
+	if 'config_check' in changed:
+		timer_jobs['config'].set_interval(config_check)
+	if 'beacon_interval' in changed:
+		for tx in transmitters:
+			if tx.beacon_job:
+				tx.beacon_job.set_interval(beacon_interval)
+	
+	# queue limits, send window and slot_lead are used from now on
+	queue_space.set()
+	for tx in transmitters:
+		tx.msg_event.set()
+	
+	return
+
+def check_config(due):
+	# reload config_file when it was changed
+	
+	if dapnet_config.mtime(config_file) != config_mtime:
+		reload_config()
+	if receiver:
+		receiver.check_config()
+	
+	return
+
 def clean_history():
 	global msg_history, msg_blocktime
-	#walk throug msg-history and clean outdates messages
+	#remove outdated messages from the front of msg-history - newer ones follow behind
 	
-	now = int(time.time())
+	now = time.monotonic()
 	removed = 0
-	for msg,ts in msg_history.copy().items():
-		if ts+msg_blocktime <= now:
-			msg_history.pop(msg)
-			removed += 1
-			if debug: print('[dau_core]','clean history - outdated msg',msg,ts,'removed')
+	while msg_history:
+		ts = next(iter(msg_history.values()))
+		if ts + msg_blocktime > now and len(msg_history) <= msg_history_max:
+			break
+		msg_history.popitem(last=False)
+		removed += 1
 	
-	if debug: print('[dau_core]','clean history - removed',removed)
+	if removed: dapnet_log.debug('[dau_core]','clean history - removed',removed)
 	return
 
 def check_history(ric,message):
 	global msg_history, msg_blocktime
 	
-	new_msg = '{:07}:{}'.format(int(ric),message)
-	now = int(time.time())
+	new_msg = hashlib.blake2b('{:07}:{}'.format(int(ric),message).encode('utf-8'), digest_size=8).digest()
+	
+	# all messages left in history are in blocktime
+	clean_history()
+	now = time.monotonic()
 	
 	if new_msg in msg_history:
-		#check time
-		if msg_history[new_msg] + msg_blocktime <= now:
-			if debug: print('[dau_core]','msg_history MSG outdated - will sent')
-			result =  True
-		else:
-			if debug: print('[dau_core]','msg_history MSG in blocktime', msg_history[new_msg]+msg_blocktime, now)
-			#should we reset blocktime?
-			result =  False
+		dapnet_log.debug('[dau_core]','msg_history MSG in blocktime', msg_history[new_msg]+msg_blocktime, now)
+		#should we reset blocktime?
+		result =  False
 	else:
-		if debug: print('[dau_core]','msg_history MSG . will sent')
+		dapnet_log.debug('[dau_core]','msg_history MSG . will sent')
 		result = True
 	
 	if result:
 		msg_history[new_msg] = now
-
+		if len(msg_history) > msg_history_max:
+			msg_history.popitem(last=False)
+	
 	return result
 
 def signal_handler(signum,frame):
-	global running, server_online, client_online, core_running, debug
+	global running
 	
-	# SIGTERM, SIGKILL
+	# SIGTERM, SIGINT, SIGHUP, SIGUSR1 (stats of receiver)
 	
 	if signum == signal.SIGTERM:
-		if not silent: print('[dau_core]','SIGTERM received ...')
+		dapnet_log.info('[dau_core]','SIGTERM received ...')
 		clean_exit()
-
+	elif signum == signal.SIGINT:
+		dapnet_log.notice('[dau_core]','user interrupt CTRL-C')
+		clean_exit()
+	elif signum == signal.SIGHUP:
+		dapnet_log.info('[dau_core]','SIGHUP received ...')
+		reload_config()
+		if receiver:
+			receiver.reload()
+	elif signum == signal.SIGUSR1:
+		if receiver:
+			receiver.stats()
+	
 	return
 
 def clean_exit():
-	global running, server_online, client_online, core_running, debug, server
+	global running
 	
-	print('[dau_core]','request shutdown ...')
+	dapnet_log.notice('[dau_core]','request shutdown ...')
 	
 	running = False
-	core_running = False
-	client_online = False
-	server_online = False
+	stop_event.set()
+	queue_space.set()
 	
-	if debug: print('[dau_core]','closing server ...')
-	try:
-		client_conn.close()
-	except:
-		pass
-	
-	server.shutdown(socket.SHUT_RDWR)
-	server.close()
+	return
 
-	if debug: print('[dau_core]','waiting for QUEUE ...')
-	msg_queue.queue.clear()
-	try:
-		queue_handle.join(5)
-	except:
-		pass
+async def core_main(ready = None):
+	global server, sock_server, api_server, stats_server, stop_event, queue_space, core_loop, running
+	
+	# ready (threading.Event) is set when the core listens for transmitters
+	loop = core_loop = asyncio.get_running_loop()
+	stop_event = asyncio.Event()
+	queue_space = asyncio.Event()
+	running = True
 	
-	if use_message_socket:
-		if debug: print('[dau_core]','waiting for SOCK ...')
-		sock_reader.join(5)
-		if not silent: print('[dau_core]','SOCK closed')
+	# register sig_handle - signals reach the main thread only, a Core in another thread is stopped by Core.stop()
+	if threading.current_thread() is threading.main_thread():
+		for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGUSR1):
+			loop.add_signal_handler(signum, signal_handler, signum, None)
+	
+	tasks = []
+	
+	# init stats
+	if stats_port:
+		try:
+			stats_server = dapnet_stats.serve(stats_address, stats_port)
+			dapnet_log.info('[STATS]','listen',stats_address,stats_port)
+		except OSError as e:
+			dapnet_log.error('[STATS]','ERROR:',e)
+	
+	# init fifo unix socket
+	await start_socket()
+	
+	# init api
+	await start_api()
+	
+	# init budgets and spool
+	configure_budgets()
+	load_spools()
+	start_timers()
+	
+	# init fifo named pipe
 	if use_message_pipe:
-		if debug: print('[dau_core]','waiting for PIPE ...')
-		pipe_reader.join(5)
-		if not silent: print('[dau_core]','PIPE closed')
+		dapnet_log.debug('[dau_core]','init PIPE ...')
+		tasks.append(asyncio.create_task(read_pipe()))
+	
+	# init server
+	dapnet_log.debug('[dau_core]','init dapnet_core ...')
+	for i in range(0,bind_max_try+1):
 		try:
-			if debug: print('[dau_core]','removing PIPE ...')
+			if running:
+				server = await asyncio.start_server(handle_client, tcp_address, tcp_port)
+				break
+		except OSError as e:
+			if e.errno == 98 and i < bind_max_try:
+				dapnet_log.info('[CLIENT]','address in use - retry ...',i+1)
+				await asyncio.sleep(6)
+			else:
+				raise
+	
+	if server:
+		dapnet_log.info('[CLIENT]','listen',tcp_address,tcp_port)
+	
+	# init receiver
+	if receiver and running:
+		dapnet_log.debug('[dau_core]','init RECEIVER ...')
+		receiver.start()
+	
+	if ready:
+		ready.set()
+	if server:
+		await stop_event.wait()
+	
+	# messages still decoded by the receiver are queued before transmitters are closed
+	if receiver:
+		dapnet_log.debug('[dau_core]','waiting for RECEIVER ...')
+		await loop.run_in_executor(None, receiver.stop)
+	
+	dapnet_log.debug('[dau_core]','closing server ...')
+	handlers = [tx.handler for tx in transmitters]
+	for tx in transmitters:
+		tx.close()
+	if server:
+		server.close()
+	if handlers:
+		await asyncio.wait(handlers, timeout=1)
+	
+	dapnet_log.debug('[dau_core]','waiting for QUEUE ...')
+	scheduler.close()
+	for task in tasks:
+		task.cancel()
+	await asyncio.gather(*tasks, return_exceptions=True)
+	
+	if sock_server:
+		stop_socket()
+		# connected clients see their connection closed - handlers end before the loop is closed
+		handlers = list(sock_clients.values())
+		for writer in list(sock_clients):
+			writer.close()
+		if handlers:
+			await asyncio.wait(handlers, timeout=1)
+		dapnet_log.info('[dau_core]','SOCK closed')
+	if use_message_pipe:
+		dapnet_log.info('[dau_core]','PIPE closed')
+		try:
+			dapnet_log.debug('[dau_core]','removing PIPE ...')
 			os.unlink(server_message_pipe)
 		except:
 			pass
+	stop_api()
+	for spool in spools.values():
+		spool.close()
+	if stats_server:
+		stats_server.shutdown()
 	
-	if debug: print('[dau_core]','ready to exit')
-	
+	dapnet_log.debug('[dau_core]','ready to exit')
+	core_loop = None
 	return
 
+def open_receiver(argv = ()):
+	global receiver
+	
+	# receiver of dapnet_sock in this process - started and stopped with the core, its metrics are served at stats_port
+	import dapnet_sock
+	receiver = dapnet_sock.Receiver(argv, deliver_received)
+	# one log for both - settings of the core apply
+	configure_log()
+	
+	return receiver
 
-# register sig_handle
-signal.signal(signal.SIGTERM, signal_handler)
-
-# init message-queue
-if debug: print('[dau_core]','init message queue ...')
-msg_queue = Queue()
-
-# init fifo unix socket
-if use_message_socket:
-	if debug: print('[dau_core]','init SOCK ...')
-	sock_reader = Thread(target=read_socket, name='SOCK')
-	sock_reader.daemon = True
-	sock_reader.start()
-
-# init fifo named pipe
-if use_message_pipe:
-	if debug: print('[dau_core]','init PIPE ...')
-	pipe_reader = Thread(target=read_pipe, name='PIPE')
-	pipe_reader.daemon = True
-	pipe_reader.start()
-
-# init server
-if debug: print('[dau_core]','init dapnet_core ...')
-server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-for i in range(0,bind_max_try+1):
-	try:
-		if running:
-			server.bind((tcp_address,tcp_port))
-			break
-	except OSError as e:
-		if e.errno == 98 and i < bind_max_try:
-			if not silent: print('[CLIENT]','address in use - retry ...',i+1)
-			time.sleep(6)
-		else:
+class Core:
+	# core used as library - runs core_main in its own thread and event loop, settings are the ones of this module
+	# only one core per process (RuntimeError on a second one until the first is stopped), e.g.
+	#   core = dapnet_dau.Core(['--port=43434', '--pipe='])
+	#   core.start()
+	#   core.submit(6, 1, 123456, 3, 'hello')
+	#   core.stop()
+	
+	def __init__(self, argv = (), receiver = False):
+		global core_instance
+		
+		# a second core would silently change the settings of the first one
+		if core_instance is not None or core_loop is not None:
+			raise RuntimeError('a core is already configured or running in this process')
+		core_instance = self
+		try:
+			configure(argv)
+			if receiver or use_receiver:
+				open_receiver(argv)
+		except BaseException:
+			core_instance = None
 			raise
+		self.thread = None
+		self.ready = threading.Event()
+	
+	def start(self, timeout = 30):
+		# returns when the core listens for transmitters
+		
+		self.ready.clear()
+		self.thread = threading.Thread(target=lambda: asyncio.run(core_main(self.ready)), name='CORE')
+		self.thread.start()
+		deadline = time.monotonic() + timeout
+		while not self.ready.wait(0.1):
+			if not self.thread.is_alive() or time.monotonic() > deadline:
+				raise RuntimeError('core did not start')
+		
+		return self
+	
+	def submit(self, m_type, m_speed, m_ric, m_function, message, tag = '[LOCAL]', timeout = None):
+		# queue message like SOCK does - returns queued, spooled, duplicate, offline, full or limited
+		
+		return submit_threadsafe(tag, m_type, m_speed, m_ric, m_function, message, timeout)
+	
+	def stop(self):
+		global core_instance, receiver
+		
+		loop = core_loop
+		if loop and running:
+			loop.call_soon_threadsafe(clean_exit)
+		if self.thread:
+			self.thread.join()
+			self.thread = None
+		
+		# core and its receiver are stopped - another Core may be configured now
+		if core_instance is self:
+			core_instance = None
+			receiver = None
+		return
 
-server.listen(1)
-if not silent: print('[CLIENT]','listen',tcp_address,tcp_port)
-server_online = True
-
-try:
-	while server_online:
-		client_conn, client_address = server.accept()
-		print('[CLIENT]','connected',client_address)
-		client_online = True
-		
-		while client_online:
-			msg_queue.queue.clear()
-			client_conn.settimeout(2)
-			data = client_conn.recv(1024).decode('utf-8')
-			client_conn.settimeout(None)
-			if debug: print('[CLIENT]','received', data)
-			
-			# Handshake
-			login = LOGIN_PATTERN.match(data)
-			login_type = login.group(1)
-			login_version = login.group(2)
-			login_callsign = login.group(3)
-			login_key = login.group(4)
-			if not silent: print('[CLIENT]','LOGIN:',login_type,login_version,login_callsign,login_key)
-			
-			# time_sync
-			for x in range(0,4):
-				if not silent: print('[CLIENT]','TIME_SYNC',x)
-				send_data('2:{:04x}'.format(x),False,True)
-				
-				# erwarte 2:0000:0000
-				time.sleep(0.1)
-				data = client_conn.recv(1024).decode('utf-8')
-				for x in ['\r\n','\r']:
-					data = data.replace(x,'')
-				time_sync = TIME_PATTERN.match(data)
-				if time_sync:
-					if debug: print('[CLIENT]','TIME_SYNC',x,'received',time_sync[1],time_sync[2])
-				else:
-					if not silent: print('[CLIENT]','TIME_SYNC',x,'received invalid response',data)
-			
-			# ack time_sync
-			if not silent: print('[CLIENT]','TIME_SYNC ACK')
-			send_data('3:+0000',True,True)
-			
-			# send slots
-			if not silent: print('[CLIENT]','SET_TIMESLOTS',client_slots)
-			send_data('4:'+client_slots,True,True)
-			
-			# main-queue
-			if not silent: print('[dau_core]','init client loop')
-
-			core_timer = 0
-			last_msg = 0
-			last_minute = datetime.datetime.now().minute
-			last_beacon = 0
-			core_running = True
-
-			if not silent: print('[CLIENT]','BEACON',client_callsign)
-			msg_queue.put(make_message(6,1,8,3,client_callsign))
-			
-			if client_online:
-				queue_handle = Thread(target=send_queue, name='QUEUE')
-				queue_handle.daemon = True
-				queue_handle.start()
-			
-			while core_running and client_online:
-				core_timer += 1
-				if core_timer == (core_ping*2):	#core runs 0.5 secs > *2
-					msg_queue.put('3:+0000')
-					core_timer = 0
-
-				minute = datetime.datetime.now().minute
-
-				# send time-messages & clean msg_history
-				if minute != last_minute:
-					last_minute = minute
-					if (last_minute % 2) == 0 and send_time_utc:
-						#gerade minute = UTC
-						if debug: print('[CLIENT]','SKYPER_TIME')
-						msg_queue.put(make_message(5,1,2504,0,time_skyper()))
-						if debug: print('[CLIENT]','SWISSPHONE_TIME')
-						msg_queue.put(make_message(6,1,208,3,time_swissphone()))
-						if debug: print('[CLIENT]','ALPHAPOC_TIME')
-						msg_queue.put(make_message(6,1,224,3,time_alphapoc()))
-					elif send_time_local:
-						#ungerade minute = Lokalzeiten
-						if debug: print('[CLIENT]','SWISSPHONE_LOCALTIME')
-						msg_queue.put(make_message(6,1,200,3,time_swissphone(True)))
-						if debug: print('[CLIENT]','ALPHAPOC_LOCALTIME')
-						msg_queue.put(make_message(6,1,216,3,time_alphapoc(True)))
-					
-					#cleanup msg_history
-					clean_history()
-				
-				#send transmitter beacon
-				if last_beacon + 10 == minute:
-					last_beacon = minute
-					if not silent: print('[CLIENT]','BEACON',client_callsign)
-					msg_queue.put(make_message(6,1,8,3,client_callsign))
-				
-				time.sleep(0.5)
-			
-			if not client_online:
-				print('[CLIENT]','disconnected',client_address)
-
-except KeyboardInterrupt:
-	print('[dau_core]','user interrupt CTRL-C')
-	clean_exit()
+def main():
+	configure(sys.argv[1:])
+	if use_receiver:
+		open_receiver(sys.argv[1:])
+	
+	asyncio.run(core_main())
+	
+	dapnet_log.debug('[dau_core]','cleanly closed !')
+	dapnet_log.close()
+	sys.exit(0)
 
-if debug: print('[dau_core]','cleanly closed !')
-sys.exit(0)
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,197 @@
+# copyright (c) 2022 by Rainer Fiedler DO6UK
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+# budgets of dapnet_dau - token buckets per source and ric, fair queue of sources per transmitter
+#
+# a budget has two buckets: messages and estimated pocsag airtime in seconds - a message needs both
+# the fair queue serves sources by deficit round robin: every source may send quantum seconds of airtime
+# in its turn, so a flood of one source delays the others by one turn at most
+
+import time
+from collections import deque, OrderedDict
+
+class TokenBucket:
+	def __init__(self, rate, burst, now = None):
+		self.rate = rate				# tokens per second - 0 is unlimited
+		self.burst = burst
+		self.tokens = burst
+		self.updated = time.monotonic() if now is None else now
+	
+	def refill(self, now):
+		self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+		self.updated = now
+		return
+	
+	def wait(self, amount, now):
+		# seconds until amount is there - 0 if it is there now
+		
+		if not self.rate:
+			return 0
+		self.refill(now)
+		# more than burst is taken when the bucket is full - a long message is not blocked for ever
+		missing = min(amount, self.burst) - self.tokens
+		
+		return max(0, missing / self.rate)
+	
+	def take(self, amount):
+		if self.rate:
+			self.tokens -= amount
+		return
+	
+	def full(self, now):
+		self.refill(now)
+		return self.tokens >= self.burst
+
+class Budget:
+	# buckets of messages and airtime per key (source or ric)
+	
+	def __init__(self, rate = 0, burst = 1, airtime = 0, airtime_burst = 1, max_keys = 10000):
+		self.buckets = OrderedDict()	# key -> (messages, airtime) in order of last use
+		self.max_keys = max_keys
+		self.configure(rate, burst, airtime, airtime_burst)
+	
+	def configure(self, rate, burst, airtime, airtime_burst):
+		# new settings - kept buckets keep their tokens
+		
+		self.rate = rate
+		self.burst = max(1, burst)
+		self.airtime = airtime
+		self.airtime_burst = max(airtime_burst, 0.001)
+		for messages, airtime_bucket in self.buckets.values():
+			messages.rate, messages.burst = self.rate, self.burst
+			airtime_bucket.rate, airtime_bucket.burst = self.airtime, self.airtime_burst
+		return
+	
+	def enabled(self):
+		return bool(self.rate or self.airtime)
+	
+	def get(self, key, now):
+		buckets = self.buckets.get(key)
+		if buckets is None:
+			buckets = self.buckets[key] = (TokenBucket(self.rate, self.burst, now), TokenBucket(self.airtime, self.airtime_burst, now))
+			self.forget(now)
+		else:
+			self.buckets.move_to_end(key)
+		return buckets
+	
+	def forget(self, now):
+		# full buckets are the same as new ones - drop the least used ones to keep memory bounded
+		
+		while len(self.buckets) > self.max_keys:
+			key, (messages, airtime_bucket) = next(iter(self.buckets.items()))
+			if not (messages.full(now) and airtime_bucket.full(now)) and len(self.buckets) < 2 * self.max_keys:
+				break
+			self.buckets.popitem(last=False)
+		return
+	
+	def wait(self, key, airtime, now = None):
+		# seconds until a message of airtime seconds is in budget of key - 0 if it is now
+		
+		if not self.enabled():
+			return 0
+		now = time.monotonic() if now is None else now
+		messages, airtime_bucket = self.get(key, now)
+		
+		return max(messages.wait(1, now), airtime_bucket.wait(airtime, now))
+	
+	def take(self, key, airtime, now = None):
+		if not self.enabled():
+			return
+		now = time.monotonic() if now is None else now
+		messages, airtime_bucket = self.get(key, now)
+		messages.take(1)
+		airtime_bucket.take(airtime)
+		return
+
+class FairQueue:
+	# queue of messages served by deficit round robin over their sources - used like a deque by Transmitter
+	# cost(entry) is the airtime of an entry, source(entry) its source
+	
+	def __init__(self, quantum, cost, source):
+		self.quantum = quantum
+		self.cost = cost
+		self.source = source
+		self.queues = {}				# source -> deque of entries
+		self.deficit = {}				# source -> airtime it may still send in its turn
+		self.active = deque()			# sources with entries - first one has its turn
+		self.count = 0
+	
+	def __len__(self):
+		return self.count
+	
+	def __iter__(self):
+		# all entries in order of queuing - entry[3] is the time it was queued
+		
+		return iter(sorted((entry for queue in self.queues.values() for entry in queue), key=lambda entry: entry[3]))
+	
+	def __getitem__(self, index):
+		# only queue[0] - entry served next
+		
+		if index != 0 or not self.count:
+			raise IndexError('FairQueue has only a head')
+		return self.head()
+	
+	def append(self, entry):
+		source = self.source(entry)
+		queue = self.queues.get(source)
+		if queue is None:
+			queue = self.queues[source] = deque()
+		if not queue:
+			# source starts its turn at once if no other one is waiting
+			self.deficit[source] = 0 if self.active else self.quantum
+			self.active.append(source)
+		queue.append(entry)
+		self.count += 1
+		return
+	
+	def head(self):
+		# entry of the source in turn - turn goes on when its deficit is too small for its next entry
+		
+		while self.active:
+			source = self.active[0]
+			entry = self.queues[source][0]
+			if self.deficit[source] >= self.cost(entry):
+				return entry
+			self.active.rotate(-1)
+			self.deficit[self.active[0]] += max(self.quantum, 0.01)
+		return None
+	
+	def popleft(self):
+		entry = self.head()
+		if entry is None:
+			raise IndexError('pop from empty FairQueue')
+		
+		source = self.active[0]
+		queue = self.queues[source]
+		queue.popleft()
+		self.count -= 1
+		self.deficit[source] -= self.cost(entry)
+		if not queue:
+			# deficit is not saved up while a source has nothing to send
+			self.active.popleft()
+			del self.queues[source]
+			del self.deficit[source]
+			if self.active:
+				self.deficit[self.active[0]] += max(self.quantum, 0.01)
+		return entry
+	
+	def clear(self):
+		self.queues.clear()
+		self.deficit.clear()
+		self.active.clear()
+		self.count = 0
+		return
+	
+	def sources(self):
+		# source -> number of entries queued
+		
+		return {source: len(queue) for source, queue in self.queues.items()}
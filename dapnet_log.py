@@ -0,0 +1,227 @@
+# copyright (c) 2022 by Rainer Fiedler DO6UK
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+# log of dapnet_dau and dapnet_sock - logging never waits for the console
+#
+# a line is kept as (time, level, tag, args) in a ring buffer and formatted by a writer thread like print() does,
+# so a slow console, journald or serial line delays the writer only. when the buffer is full the oldest line
+# is dropped and counted - the writer reports how many were lost.
+#
+# levels are set per subsystem - first word of the tag in lower case: [CLIENT do1abc] -> client, [dau_core] -> dau_core
+#   debug	everything
+#   info	messages, connections, reloads - default
+#   notice	start, stop and answers to signals - shown in silent mode
+#   error	errors only
+
+import sys,time,json,atexit
+from threading import Thread, Event, Lock
+from collections import deque
+import dapnet_stats
+
+DEBUG = 10
+INFO = 20
+NOTICE = 30
+ERROR = 40
+
+LEVELS = {'debug': DEBUG, 'info': INFO, 'notice': NOTICE, 'error': ERROR}
+LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+
+level = INFO				# level of subsystems not in levels
+levels = {}					# subsystem -> level
+tag_levels = {}				# tag -> level of its subsystem - looked up once per tag
+json_lines = False			# write json objects instead of text
+stream = None				# file to write to - None is sys.stdout
+
+buffer = deque(maxlen=10000)
+wakeup = Event()
+writer = None
+writer_lock = Lock()
+closing = False
+
+dropped = 0					# lines lost because buffer was full
+reported = 0				# dropped lines the writer has reported
+written = 0
+
+dapnet_stats.Counter('dapnet_log_dropped_total','log lines dropped because the log buffer was full',lambda: dropped)
+dapnet_stats.Counter('dapnet_log_written_total','log lines written',lambda: written)
+dapnet_stats.Gauge('dapnet_log_buffer_entries','log lines waiting for the writer',lambda: len(buffer))
+
+class Lazy:
+	# text formatted by the writer only, e.g. dapnet_log.info(tag,'MSG_ACK',dapnet_log.Lazy('{:.1f}ms',latency))
+	
+	__slots__ = ('text', 'values')
+	
+	def __init__(self, text, *values):
+		self.text = text
+		self.values = values
+	
+	def __str__(self):
+		return self.text.format(*self.values)
+
+def level_value(value):
+	# level of a name (debug, info, notice, error) or number
+	
+	if isinstance(value, int):
+		return value
+	try:
+		return LEVELS[str(value).lower()]
+	except KeyError:
+		raise ValueError('unknown log level {}'.format(value))
+
+def subsystem(tag):
+	return str(tag).strip('[]').split(' ')[0].lower()
+
+def configure(default_level = INFO, subsystem_levels = {}, as_json = False, buffer_max = 10000):
+	# raises ValueError on unknown levels - nothing is changed then
+	
+	global level, levels, json_lines, buffer
+	
+	new_level = level_value(default_level)
+	new_levels = {name.lower(): level_value(value) for name, value in subsystem_levels.items()}
+	
+	level = new_level
+	levels = new_levels
+	json_lines = as_json
+	tag_levels.clear()
+	if buffer_max != buffer.maxlen:
+		# lines are moved, not copied - the writer may take some of them at the same time
+		resized = deque(maxlen=max(1, buffer_max))
+		while True:
+			try:
+				resized.append(buffer.popleft())
+			except IndexError:
+				break
+		buffer = resized
+	
+	return
+
+def enabled(log_level, tag):
+	threshold = tag_levels.get(tag)
+	if threshold is None:
+		threshold = tag_levels[tag] = levels.get(subsystem(tag), level)
+	return log_level >= threshold
+
+def log(log_level, tag, *args):
+	# keep line for the writer - formatted there
+	
+	global dropped
+	
+	if not enabled(log_level, tag):
+		return
+	
+	if len(buffer) >= buffer.maxlen:
+		dropped += 1
+	buffer.append((time.time(), log_level, tag, args))
+	
+	if writer is None:
+		start()
+	if not wakeup.is_set():
+		wakeup.set()
+	return
+
+def debug(tag, *args):
+	log(DEBUG, tag, *args)
+	return
+
+def info(tag, *args):
+	log(INFO, tag, *args)
+	return
+
+def notice(tag, *args):
+	log(NOTICE, tag, *args)
+	return
+
+def error(tag, *args):
+	log(ERROR, tag, *args)
+	return
+
+def format_line(record):
+	timestamp, log_level, tag, args = record
+	
+	message = ' '.join(str(arg) for arg in args)
+	if json_lines:
+		return json.dumps({'time': round(timestamp, 6), 'level': LEVEL_NAMES.get(log_level, log_level),
+			'subsystem': subsystem(tag), 'tag': str(tag), 'message': message}, ensure_ascii=False)
+	
+	return str(tag) + ' ' + message if message else str(tag)
+
+def flush():
+	# write all buffered lines - called by the writer
+	
+	global reported, written
+	
+	lines = []
+	while True:
+		try:
+			record = buffer.popleft()
+		except IndexError:
+			break
+		try:
+			lines.append(format_line(record))
+		except Exception as e:
+			lines.append(format_line((record[0], ERROR, '[LOG]', ('ERROR:', repr(e)))))
+	
+	if dropped != reported:
+		lost = dropped - reported
+		reported += lost
+		lines.append(format_line((time.time(), NOTICE, '[LOG]', ('log buffer full -', lost, 'lines dropped'))))
+	
+	if lines:
+		out = stream or sys.stdout
+		try:
+			out.write('\n'.join(lines) + '\n')
+			out.flush()
+		except (OSError, ValueError):
+			# console is gone - nothing left to tell
+			pass
+		written += len(lines)
+	
+	return
+
+def write_lines():
+	while True:
+		wakeup.wait(1)
+		wakeup.clear()
+		flush()
+		if closing and not buffer:
+			break
+	return
+
+def start():
+	# start writer - done by the first line logged
+	
+	global writer, closing
+	
+	with writer_lock:
+		if writer is None:
+			closing = False
+			writer = Thread(target=write_lines, name='LOG')
+			writer.daemon = True
+			writer.start()
+			atexit.register(close)
+	return
+
+def close(timeout = 5):
+	# write what is left and stop writer - lines logged later start it again
+	
+	global writer, closing
+	
+	with writer_lock:
+		thread = writer
+		if thread is None:
+			return
+		closing = True
+		wakeup.set()
+		thread.join(timeout)
+		writer = None
+		atexit.unregister(close)
+	return
@@ -0,0 +1,117 @@
+# copyright (c) 2022 by Rainer Fiedler DO6UK
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+# codec of the link between core and transmitter - lines in both directions end with \r\n
+#
+# transmitter -> core:
+#   [UniPager v1.0.2 do6uk 01234]	login: type, version, callsign, key
+#   2:0000:1a2b						time sync reply: round, time of transmitter
+#   #0A +							ack of message #0A: + sent, % retry later, - rejected
+#   + or -							ack of DATA (time sync ack, timeslots, ...)
+#
+# core -> transmitter:
+#   2:0000							time sync round
+#   3:+0000							time correction
+#   4:2389D							timeslots
+#   #0A 6:1:8:3:text				message with #XX counter
+
+import re
+
+LOGIN_PATTERN = re.compile(r'^\[(.+)\s(v.+)\s(\w{2}\d\w{2,3})\s(.+)]')
+TIME_PATTERN = re.compile(r'^2\:(.{4}):(.{4})')
+MSG_ACK_PATTERN = re.compile(r'^#(..)\s([\+\-%])')
+
+# events of decoder
+LOGIN = 'login'				# (type, version, callsign, key)
+TIME = 'time'				# (round, time)
+MSG_ACK = 'msg_ack'			# (counter, result)
+DATA_ACK = 'data_ack'		# (result,)
+INVALID = 'invalid'			# (line,)
+
+# longest line expected from transmitter - longer lines are garbage and dropped
+LINE_MAX = 1024
+
+class Decoder:
+	# incremental decoder of transmitter replies - takes data as received, returns complete replies
+	# replies merged into one segment or split over many segments by tcp come out the same
+	
+	def __init__(self, line_max = LINE_MAX):
+		self.buffer = b''
+		self.line_max = line_max
+		self.overlong = False		# dropping rest of a line longer than line_max
+	
+	def feed(self, data):
+		# list of (event, fields) of all lines completed by data
+		
+		# transmitters end lines with \r\n, some with \n or \r only
+		lines = (self.buffer + data).replace(b'\r\n', b'\n').replace(b'\r', b'\n').split(b'\n')
+		self.buffer = lines.pop()
+		# a \r at the end of data may be the first half of \r\n - the empty line it leaves is skipped
+		
+		events = []
+		for line in lines:
+			if self.overlong:
+				self.overlong = False
+				continue
+			if len(line) > self.line_max:
+				events.append(overlong(line))
+				continue
+			line = line.decode('utf-8', 'replace').strip()
+			if line:
+				events.append(decode_line(line))
+		
+		if len(self.buffer) > self.line_max:
+			if not self.overlong:
+				events.append(overlong(self.buffer))
+			self.buffer = b''
+			self.overlong = True
+		
+		return events
+
+def overlong(line):
+	# garbage is shown shortened only
+	
+	return INVALID, (line[:40].decode('utf-8', 'replace') + '...',)
+
+def decode_line(line):
+	# (event, fields) of one line without line end
+	
+	if line[0] == '#':
+		msg_ack = MSG_ACK_PATTERN.match(line)
+		if msg_ack:
+			return MSG_ACK, (msg_ack[1].upper(), msg_ack[2])
+	elif line in ('+', '-'):
+		return DATA_ACK, (line,)
+	elif line[0] == '2':
+		time_sync = TIME_PATTERN.match(line)
+		if time_sync:
+			return TIME, (time_sync[1], time_sync[2])
+	elif line[0] == '[':
+		login = LOGIN_PATTERN.match(line)
+		if login:
+			return LOGIN, (login[1], login[2], login[3], login[4])
+	
+	return INVALID, (line,)
+
+def encode(data):
+	# line sent to transmitter
+	
+	return (data + '\r\n').encode('utf-8')
+
+def time_sync(x):
+	return '2:{:04x}'.format(x)
+
+def time_ack(correction = 0):
+	return '3:{:+05x}'.format(correction)
+
+def set_slots(slots):
+	return '4:' + slots
@@ -12,9 +12,10 @@
 #  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 #  GNU General Public License for more details.
 
-import sys,socket,re,time,signal
-from queue import Queue
-from threading import Thread
+import os,sys,re,socket,time,signal,hashlib,select,selectors,errno,shlex,subprocess,pty,tty
+from threading import Thread, Condition, Lock
+from collections import deque, OrderedDict
+import dapnet_log, dapnet_stats, dapnet_config, multimon
 
 # blacklist some rics - i will block all rics, which are generated by fake-core
 ric_blacklist = [8,208,224,200,216,2504] 
@@ -22,199 +23,1035 @@ ric_blacklist = [8,208,224,200,216,2504]
 # use unix-socket to submit messages to fake-core
 server_message_socket = '/tmp/dapnet_dau.s'
 
-# enable debugging (more useless information at console ;-)
+# seconds a message received again (e.g. from another transmitter) is dropped as duplicate - 0 disables
+dedup_window = 60
+
+# maximum number of messages remembered for duplicate check - oldest are forgotten first
+dedup_max = 10000
+
+# messages kept while core is not reachable - oldest are dropped if full, stdin waits while core is reachable
+queue_max = 1000
+
+# messages sent to core without waiting for their ack
+send_window = 64
+
+# seconds to wait before reconnecting to core - doubled on every failed attempt
+reconnect_min = 0.5
+reconnect_max = 30
+
+# spawn and supervise the decoder chain instead of reading stdin - can be reached by --decoder in cli
+# every stage reads the output of the one before, the last one writes to a pty so lines are not buffered
+use_decoder = False
+decoder_commands = [
+	'rtl_fm -E dc -f 439.9875M -s 22050 -',
+	'multimon-ng -a POCSAG512 -a POCSAG1200 -a POCSAG2400 -t raw -',
+]
+
+# decode raw audio (signed 16 bit, native_rate samples per second) of rtl_fm in process instead of multimon-ng
+# needs numpy - can be reached by --native in cli, with --decoder only the first of decoder_commands is started
+# native_speeds are decoded side by side like multimon-ng -a POCSAG512 -a POCSAG1200 -a POCSAG2400
+use_native = False
+native_rate = 22050
+native_speeds = [0, 1, 2]
+
+# seconds to wait before a failed decoder chain is restarted - doubled on every failure in a row
+decoder_restart_min = 1
+decoder_restart_max = 60
+
+# seconds without any output of the decoder before it is restarted - 0 disables
+# dapnet sends time messages every minute, so a working receiver is never silent for long
+decoder_watchdog = 300
+
+# more inputs of multimon-ng lines read at once instead of stdin - can be added by --input=... in cli
+# all of them share blacklist, duplicate check and the connection to core, name= in front sets the name in log and metrics
+#   'fifo:/tmp/rx2.fifo'											named pipe - created if missing
+#   'exec:rtl_fm -f 439.9875M -s 22050 - | multimon-ng -a POCSAG1200 -t raw -'	command chain - restarted like the decoder
+#   'tcp:192.168.1.20:7355'										tcp feed of another receiver - reconnected
+#   'stdin'														stdin as one of the inputs
+input_sources = []
+
+# local http port serving runtime metrics in prometheus text format - 0 disables
+stats_address = '127.0.0.1'
+stats_port = 9434
+
+# enable debugging (more useless information at console ;-) - same as log_level = 'debug'
 debug = False
 
-# enable silentmode (mostly no output) can be reached by --silent in cli
+# enable silentmode (mostly no output) can be reached by --silent in cli - same as log_level = 'notice'
 silent = False
 
+# log level of all subsystems: debug, info, notice (start, stop, signals) or error
+log_level = 'info'
+
+# log level per subsystem - first word of the tag in the log in lower case, e.g. {'client': 'debug', 'sock': 'notice'}
+log_levels = {}
+
+# lines waiting for the console - if it is slower than the receiver, the oldest lines are dropped (and counted) instead of delaying messages
+log_buffer = 10000
+
+# write log lines as json objects (time, level, subsystem, tag, message) instead of text
+log_json = False
+
+# config file with section [dapnet_sock] - overrides settings above, reloaded on SIGHUP or when it changes
+# can be reached by --config= in cli
+config_file = './dapnet.conf'
+
+# seconds between checks of config_file for changes - 0 reloads only on SIGHUP
+config_check = 5
+
 
 ### do not edit below this line
 
-version = '20221205'
+# settings above - may be set in config_file
+config_defaults = {name: value for name, value in globals().items() if not name.startswith('_') and isinstance(value, (str, int, float, list, dict)) and name != 'config_file'}
 
-MULTIMON = re.compile(r'^POCSAG1200:\sAddress:\s+(\d+)\s+Function:\s+(\d)\s+(Alpha|Numeric):\s+(.+)')
+# settings only applied at start
+config_restart = ('use_decoder', 'use_native', 'stats_address', 'stats_port')
 
-message_queue = Queue()
+version = '20221205'
+
+message_queue = deque()
+message_lock = Condition()
 running = True
 
+# messages sent to core waiting for ack - [message, sent] resent after reconnect
+message_unacked = deque()
+sock_connect = False
+
+# hash of ric, function and text -> time first received
+dedup_index = OrderedDict()
+dedup_passed = 0
+dedup_suppressed = 0
+
 que_handler = None
-stdin_read = None
+input_threads = []
+input_lock = Lock()			# blacklist and duplicate check of decoder and inputs
+sources = []
+sources_reload = False
+sources_thread = None
+stats_server = None
+
+# function of the process the receiver runs in, taking (msg_data, received) - None sends messages to core by server_message_socket
+deliver = None
+
+# Receiver of this process - settings are module globals, there can be only one
+receiver_instance = None
+
+# settings given at cli - set by configure()
+config_mtime = None
+config_cli = set()
+
+# running processes of decoder chain - decoder_reload restarts it with new settings
+decoder_procs = []
+decoder_reload = False
 
-print('[dau_receiver]','starting dapnet_receiver v%s ...'%version)
+# runtime metrics - served at stats_port
+stats_lines = dapnet_stats.Counter('dapnet_sock_lines_total','lines read per source')
+stats_messages = dapnet_stats.Counter('dapnet_sock_messages_total','decoded messages per source and result (queued, blacklisted, duplicate, invalid, dropped)')
+stats_source_errors = dapnet_stats.Counter('dapnet_sock_source_errors_total','errors of inputs per source and error (open, connect, read, exited, watchdog)')
+stats_queue_dropped = dapnet_stats.Counter('dapnet_sock_queue_dropped_total','messages dropped because queue was full')
+stats_sent = dapnet_stats.Counter('dapnet_sock_sent_total','messages sent to core')
+stats_acks = dapnet_stats.Counter('dapnet_sock_acks_total','acks received from core')
+stats_ack_latency = dapnet_stats.Histogram('dapnet_sock_ack_latency_seconds','seconds from sending a message to its ack by core')
+stats_connects = dapnet_stats.Counter('dapnet_sock_connects_total','connections to core per result (ok, failed)')
+stats_stage_latency = dapnet_stats.Histogram('dapnet_sock_stage_latency_seconds','seconds per stage (parse: read to queued, queue: queued to sent to core)')
+stats_decoder_restarts = dapnet_stats.Counter('dapnet_sock_decoder_restarts_total','restarts of decoder chain per failed stage')
+dapnet_stats.Gauge('dapnet_sock_queue_depth','messages waiting for core',lambda: len(message_queue))
+dapnet_stats.Gauge('dapnet_sock_unacked','messages sent to core waiting for ack',lambda: len(message_unacked))
+dapnet_stats.Gauge('dapnet_sock_dedup_entries','messages remembered for duplicate check',lambda: len(dedup_index))
+dapnet_stats.Gauge('dapnet_sock_sources_open','inputs open or connected',lambda: sum(1 for source in sources if source.fd is not None))
 
-if '--silent' in sys.argv:
-	if debug: print('[dau_receiver]','running silent mode will set  debug = False')
-	silent = True
-	debug = False
+def configure_log():
+	# debug and silent are shortcuts of log_level
+	
+	try:
+		default_level = dapnet_log.DEBUG if debug else dapnet_log.level_value(log_level)
+		if silent:
+			default_level = max(default_level, dapnet_log.NOTICE)
+		dapnet_log.configure(default_level, log_levels, log_json, log_buffer)
+	except ValueError as e:
+		dapnet_log.error('[CONFIG]','ERROR:',e)
+	
+	return
+
+def configure(argv = ()):
+	global config_file, config_mtime, config_cli, silent, debug, server_message_socket, stats_port, use_decoder, use_native, input_sources
+	
+	# apply config_file and cli arguments (e.g. sys.argv[1:]) to the settings above
+	dapnet_log.notice('[dau_receiver]','starting dapnet_receiver v%s ...'%version)
+	
+	# config file first - cli overrides it
+	for arg in argv:
+		if arg.startswith('--config='):
+			config_file = arg[9:]
+	config_mtime = dapnet_config.mtime(config_file)
+	config_values = dapnet_config.read(config_file, 'dapnet_sock', config_defaults)
+	if config_values:
+		dapnet_config.update(globals(), config_values)
+		dapnet_log.notice('[CONFIG]','loaded',config_file)
+	config_cli = {name: globals()[name] for name in config_defaults}
+	
+	if '--silent' in argv:
+		dapnet_log.debug('[dau_receiver]','running silent mode will set  debug = False')
+		silent = True
+		debug = False
+	
+	for arg in argv:
+		# override settings at cli e.g. --socket=/tmp/dau.s --stats=0 --decoder --native --config=./dapnet.conf
+		if arg.startswith('--socket='):
+			server_message_socket = arg[9:]
+		elif arg.startswith('--stats='):
+			stats_port = int(arg[8:] or 0)
+		elif arg == '--decoder':
+			use_decoder = True
+		elif arg == '--native':
+			use_native = True
+		elif arg.startswith('--input='):
+			input_sources = input_sources + [arg[8:]]
+	
+	# settings given at cli are kept on reload
+	config_cli = {name for name, value in config_cli.items() if globals()[name] != value}
+	configure_log()
+	
+	return
 
-def clean_message(msg):
-	remove = ['DEL','NUL','DLE','SOH','DC','STX','ETX','EOT','ENQ','NAK','ACK','SYN','BEL','ETB','BS','CAN','HT','EM','LF','SUB','VT','ESC','FF','FS','CR','GS','SO','RS','SI','US']
-	for char in remove:
-		msg = msg.replace('<{}>'.format(char),'')
+def check_duplicate(ric, function, message):
+	global dedup_passed, dedup_suppressed
+	
+	# True if message was already received within dedup_window
+	if not dedup_window:
+		return False
+	
+	key = hashlib.blake2b('{}:{}:{}'.format(ric,function,message).encode('utf-8'), digest_size=8).digest()
+	now = time.monotonic()
+	
+	# index is in order of time - forget expired and exceeding entries from the front
+	while dedup_index:
+		oldest = next(iter(dedup_index.values()))
+		if oldest + dedup_window > now and len(dedup_index) < dedup_max:
+			break
+		dedup_index.popitem(last=False)
+	
+	if key in dedup_index:
+		dedup_suppressed += 1
+		return True
 	
-	return msg
+	dedup_index[key] = now
+	dedup_passed += 1
+	return False
+
+def put_message(data, received):
+	# put message in bounded queue - wait while core takes messages, drop oldest message if core is not reachable
+	# received is the time its line was read
+	
+	with message_lock:
+		while running and sock_connect and len(message_queue) >= queue_max:
+			message_lock.wait(0.5)
+		if len(message_queue) >= queue_max:
+			dropped, queued = message_queue.popleft()
+			stats_queue_dropped.inc()
+			dapnet_log.info('[SOCK]','queue full - message dropped',dropped)
+		now = time.monotonic()
+		stats_stage_latency.observe(now - received, stage='parse')
+		message_queue.append((data, now))
+		message_lock.notify_all()
+	
+	return
+
+def read_acks(unix_socket):
+	global sock_connect
+	
+	buffer = ''
+	while running and sock_connect:
+		try:
+			data = unix_socket.recv(1024).decode('utf-8')
+		except OSError:
+			data = ''
+		
+		if not data:
+			if sock_connect: dapnet_log.info('[SOCK]','connection lost')
+			break
+		
+		buffer += data
+		lines = buffer.split('\n')
+		buffer = lines.pop()
+		with message_lock:
+			for line in lines:
+				line = line.strip()
+				if not line:
+					continue
+				if message_unacked:
+					message, sent = message_unacked.popleft()
+					stats_ack_latency.observe(time.monotonic() - sent)
+				else:
+					message = None
+				if line[0] == '+':
+					dapnet_log.debug('[SOCK]','MSG ACK',message)
+					stats_acks.inc()
+				else:
+					dapnet_log.debug('[SOCK]','received invalid response',line)
+			message_lock.notify_all()
+	
+	with message_lock:
+		sock_connect = False
+		message_lock.notify_all()
+	
+	return
 
 def handle_queue():
-	global running, message_queue
+	global running, sock_connect
 	
-	conn_attemp = 0
-	sock_connect = False
+	# keep one connection to core and stream messages through it
+	reconnect_wait = reconnect_min
 	while running:
-		if not message_queue.empty():
-			unix_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		unix_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			unix_socket.connect(server_message_socket)
+		except OSError:
+			unix_socket.close()
+			stats_connects.inc(result='failed')
+			dapnet_log.info('[SOCK]','not connected - retry in {}s ...'.format(reconnect_wait))
+			time.sleep(reconnect_wait)
+			reconnect_wait = min(reconnect_wait * 2, reconnect_max)
+			continue
+		
+		dapnet_log.debug('[SOCK]','connected')
+		stats_connects.inc(result='ok')
+		reconnect_wait = reconnect_min
+		sock_connect = True
+		ack_read = Thread(target=read_acks, args=(unix_socket,))
+		ack_read.daemon = True
+		ack_read.start()
+		
+		while running and sock_connect:
+			with message_lock:
+				if not message_queue or len(message_unacked) >= send_window:
+					message_lock.wait(0.5)
+					continue
+				message, queued = message_queue.popleft()
+				now = time.monotonic()
+				stats_stage_latency.observe(now - queued, stage='queue')
+				message_unacked.append([message, now])
+				if len(message_queue) == queue_max - 1:
+					message_lock.notify_all()
+			
+			dapnet_log.info('[SOCK]','MSG',message)
 			try:
-				conn_attemp += 1
-				unix_socket.connect(server_message_socket)
-				if debug: print('[SOCK]','connected')
-				conn_attemp = 0
-				sock_connect = True
-			except ConnectionRefusedError:
-				if not silent: print('[SOCK]','not connected - retry ...')
-				time.sleep(3)
+				unix_socket.sendall((message + '\n').encode('utf-8'))
+				stats_sent.inc()
+				dapnet_log.debug('[SOCK]','MSG send')
+			except OSError:
+				dapnet_log.info('[SOCK]','connection lost')
 				sock_connect = False
-				
-				if conn_attemp >= 3:
-					# clear queue
-					if conn_attemp == 3 or debug:
-						if not silent: print('[SOCK]','too many attemps to connect - dropping queue ...')
-					message_queue.queue.clear()
-
-				continue
-			
-			while not message_queue.empty() and sock_connect:
-				message = message_queue.get()
-				if not silent: print('[SOCK]','MSG',message)
-				try:
-					unix_socket.sendall(message.encode('utf-8'))
-					if debug: print('[SOCK]','MSG send')
-				except BrokenPipeError:
-					try:
-						sock_connect = False
-						unix_socket.connect(server_message_socket)
-						unix_socket.sendall(message.encode('utf-8'))
-						if not silent: print('[SOCK]','MSG send retry')
-					except:
-						sock_connect = False
-						break
-				
-				try:
-					data = unix_socket.recv(1024).decode('utf-8')
-					if data[0] == '+':
-						if debug: print('[SOCK]','MSG ACK')
-					else:
-						if debug: print('[SOCK]','received invalid response',data.rstrip())
-				except ConnectionResetError:
-					print('[SOCK]','connection reset - retry ...')
-					try:
-						unix_socket.connect(server_message_socket)
-						unix_socket.sendall(message.encode('utf-8'))
-					except ConnectionRefusedError:
-						sock_connect = False
-						break
-					except:
-						sock_connect = False
-						break
-				
-				time.sleep(0.1)
-				
-			sock_connect = False
-			unix_socket.close()
-			if debug: print('[SOCK]','closed')
-
-		time.sleep(0.1)
+		
+		sock_connect = False
+		try:
+			unix_socket.shutdown(socket.SHUT_RDWR)
+		except OSError:
+			pass
+		unix_socket.close()
+		ack_read.join(5)
+		dapnet_log.debug('[SOCK]','closed')
+		
+		# unacked messages go back in front of the queue
+		with message_lock:
+			if message_unacked:
+				dapnet_log.info('[SOCK]','requeue unacked messages',len(message_unacked))
+				message_queue.extendleft(reversed([(message, sent) for message, sent in message_unacked]))
+				message_unacked.clear()
+				while len(message_queue) > queue_max:
+					message_queue.popleft()
+	
+	return
 
 def signal_handler(signum,frame):
-	global running, debug
+	global running
 	
-	# SIGTERM, SIGKILL
+	# SIGTERM, SIGKILL, SIGUSR1, SIGHUP
 	
 	if signum == signal.SIGTERM:
-		if not silent: print('[dau_receiver]','SIGTERM received ...')
+		dapnet_log.info('[dau_receiver]','SIGTERM received ...')
 		clean_exit()
+	elif signum == signal.SIGUSR1:
+		print_stats()
+	elif signum == signal.SIGHUP:
+		dapnet_log.info('[dau_receiver]','SIGHUP received ...')
+		reload_config()
+	
+	return
+
+def reload_config():
+	global config_mtime, sock_connect, decoder_reload, sources_reload
+	
+	# read config_file again and apply changed settings - blacklist, dedup and queue settings are used at once
+	config_mtime = dapnet_config.mtime(config_file)
+	values = dapnet_config.read(config_file, 'dapnet_sock', config_defaults, config_cli)
+	if values is None:
+		dapnet_log.notice('[CONFIG]',config_file,'not found')
+		return
+	
+	changed = set(dapnet_config.update(globals(), values))
+	dapnet_log.info('[CONFIG]','reloaded',config_file,'- changed',', '.join(sorted(changed)) or 'nothing')
+	
+	for name in changed.intersection(config_restart):
+		dapnet_log.notice('[CONFIG]',name,'is applied on restart')
+	
+	# in the process of core its log settings apply
+	if not deliver and changed & {'debug', 'silent', 'log_level', 'log_levels', 'log_json', 'log_buffer'}:
+		configure_log()
+	
+	with message_lock:
+		if 'server_message_socket' in changed and sock_connect:
+			# reconnect to new socket - unacked messages are resent there
+			sock_connect = False
+		message_lock.notify_all()
+	
+	if 'input_sources' in changed:
+		if sources_thread:
+			# read_sources opens the new list
+			sources_reload = True
+		else:
+			dapnet_log.notice('[CONFIG]','input_sources is applied on restart')
+	
+	if use_decoder and changed & {'decoder_commands', 'native_rate', 'native_speeds'}:
+		decoder_reload = True
+		for proc in list(decoder_procs):
+			if proc.poll() is None:
+				proc.terminate()
+	
+	return
 
+def print_stats(log_level = dapnet_log.NOTICE):
+	dapnet_log.log(log_level,'[dau_receiver]','duplicates suppressed',dedup_suppressed,'passed',dedup_passed,'remembered',len(dedup_index))
+	if use_decoder:
+		restarts = ['{} {}'.format(dict(key)['stage'], value) for key, value in stats_decoder_restarts.values.items()]
+		dapnet_log.log(log_level,'[dau_receiver]','decoder restarts',', '.join(restarts) or 0)
+	for source in list(sources):
+		seconds = max(time.monotonic() - source.started, 1)
+		dapnet_log.log(log_level,source.tag,'{}, lines {} ({:.1f}/s), messages {} ({:.1f}/s), invalid {}, errors {}'.format('open' if source.fd is not None else 'closed',
+			source.lines, source.lines / seconds, source.messages, source.messages / seconds, source.invalid, source.errors))
 	return
 
 def clean_exit():
-	global running, que_handler, stdin_read
+	global running, que_handler
 	
-	print('[dau_receiver]','request shutdown ...')
+	dapnet_log.notice('[dau_receiver]','request shutdown ...')
 	
 	running = False
 	
-	if debug: print('[dau_receiver]','waiting for STDIN ...')
-	stdin_read.join(5)
-	time.sleep(1)
-	if debug: print('[dau_receiver]','waiting for QUEUE ...')
-	que_handler.join(5)
+	# decoder thread cleans up the chain when its output ends
+	for proc in list(decoder_procs):
+		if proc.poll() is None:
+			proc.terminate()
+	
+	dapnet_log.debug('[dau_receiver]','waiting for INPUT ...')
+	for thread in input_threads:
+		thread.join(5)
 	time.sleep(1)
+	if que_handler:
+		dapnet_log.debug('[dau_receiver]','waiting for QUEUE ...')
+		que_handler.join(5)
+		time.sleep(1)
+	
+	print_stats(dapnet_log.INFO)
+	if stats_server:
+		stats_server.shutdown()
+	dapnet_log.debug('[dau_receiver]','ready to exit')
+	
+	return
 
-	if debug: print('[dau_receiver]','ready to exit')
+def handle_message(tag, source, msg_data, received):
+	# decoded message (m_type, m_speed, m_ric, m_function, message) - blacklist, duplicate check and queue
+	# source is the name of the input in metrics
+	
+	m_type, m_speed, m_ric, m_function, message = msg_data
+	dapnet_log.debug(tag,'MSG:',m_ric,m_function,m_type,message)
+	
+	with input_lock:
+		if m_ric in ric_blacklist:
+			result = 'blacklisted'
+		elif check_duplicate(m_ric,m_function,message):
+			result = 'duplicate'
+		else:
+			result = 'queued'
+	
+	if result == 'blacklisted':
+		dapnet_log.info(tag,'message dropped - address blacklisted',m_ric)
+	elif result == 'duplicate':
+		dapnet_log.info(tag,'message dropped - duplicate',m_ric)
+	elif deliver:
+		# core in this process - waits while its queue is full like put_message
+		now = time.monotonic()
+		stats_stage_latency.observe(now - received, stage='parse')
+		try:
+			deliver(msg_data, received)
+			stats_stage_latency.observe(time.monotonic() - now, stage='queue')
+		except Exception as e:
+			dapnet_log.error(tag,'ERROR: message dropped -',repr(e))
+			result = 'dropped'
+	else:
+		data = '{:1}:{:1}:{}:{:1}:{}'.format(m_type,m_speed,m_ric,m_function,message)
+		put_message(data, received)
+	stats_messages.inc(result=result, source=source)
 	
 	return
 
-def read_stdin():
+def handle_lines(tag, source, lines, received):
+	# parse lines of multimon-ng - returns (messages, invalid lines)
+	
+	stats_lines.inc(len(lines), source=source)
+	messages = invalid = 0
+	for line in lines:
+		if not running: break
+		dapnet_log.debug(tag,'received data',line.rstrip())
+		
+		# parse data
+		msg_data = multimon.parse_line(line)
+		if msg_data:
+			handle_message(tag, source, msg_data, received)
+			messages += 1
+		else:
+			dapnet_log.debug(tag,'received invalid message',line.rstrip())
+			stats_messages.inc(result='invalid', source=source)
+			invalid += 1
+	
+	return messages, invalid
+
+def read_input(fd, tag, source, watchdog = 0, receivers = None):
 	global running, que_handler, message_queue, ric_blacklist
+	
+	# read fd in chunks - every complete line in a chunk is parsed, partial lines wait for the next chunk
+	# with receivers the chunks are raw samples decoded in process
+	# returns on end of file or if nothing was read for watchdog seconds - True on end of file
+	buffer = b''
+	last_read = time.monotonic()
+	while running:
+		if watchdog:
+			try:
+				ready = select.select([fd], [], [], min(1, watchdog))[0]
+			except OSError:
+				ready = [fd]
+			if not ready:
+				if time.monotonic() - last_read >= watchdog:
+					dapnet_log.info(tag,'no output for',watchdog,'seconds')
+					return False
+				continue
+		
+		try:
+			data = os.read(fd, 65536)
+		except OSError:
+			# pty returns EIO if decoder is gone
+			data = b''
+		received = last_read = time.monotonic()
+		
+		if receivers:
+			if not data:
+				# message at end of recording
+				for receiver in receivers:
+					receiver.decoder.flush()
+					for msg_data in receiver.decoder.take():
+						handle_message(tag, source, msg_data, received)
+				dapnet_log.debug(tag,'closed')
+				break
+			# samples are 2 bytes - an odd byte waits for the next chunk
+			data = buffer + data
+			buffer = data[len(data) & ~1:]
+			samples = pocsag_rx.numpy.frombuffer(data[:len(data) & ~1], pocsag_rx.numpy.int16)
+			for receiver in receivers:
+				for msg_data in receiver.feed(samples):
+					stats_lines.inc(source=source)
+					handle_message(tag, source, msg_data, received)
+			continue
+		
+		if not data:
+			if not buffer:
+				dapnet_log.debug(tag,'closed')
+				break
+			# last line without newline
+			data = b'\n'
+		
+		lines, buffer = multimon.split_lines(buffer, data)
+		handle_lines(tag, source, lines, received)
+	
+	return True
+
+def native_receivers():
+	# in process receivers of native_speeds - None if numpy is missing
+	
+	global pocsag_rx
+	try:
+		import pocsag_rx
+		return [pocsag_rx.Receiver(m_speed, native_rate) for m_speed in native_speeds]
+	except ImportError as e:
+		dapnet_log.error('[dau_receiver]','ERROR:',e)
+		return None
+
+def read_stdin():
+	receivers = native_receivers() if use_native else None
+	if use_native and not receivers:
+		return
+	
+	read_input(sys.stdin.fileno(), '[STDIN]', 'stdin', 0, receivers)
+	return
+
+def start_decoder(commands, procs = None, tag = '[DECODER]'):
+	# spawn decoder chain - output of last stage goes to a pty, so it is line buffered like on a terminal
+	# returns fd to read decoded lines from
+	
+	if procs is None:
+		procs = decoder_procs
+	
+	master, slave = pty.openpty()
+	tty.setraw(slave)
+	try:
+		stdin = subprocess.DEVNULL
+		for i, command in enumerate(commands):
+			last = i == len(commands) - 1
+			proc = subprocess.Popen(shlex.split(command), stdin=stdin, stdout=slave if last else subprocess.PIPE,
+				stderr=None if dapnet_log.enabled(dapnet_log.DEBUG, tag) else subprocess.DEVNULL, start_new_session=True)
+			if stdin is not subprocess.DEVNULL:
+				stdin.close()
+			stdin = proc.stdout
+			procs.append(proc)
+			dapnet_log.info(tag,'started',command,'pid',proc.pid)
+	except OSError:
+		os.close(master)
+		raise
+	finally:
+		os.close(slave)
+	
+	return master
+
+def stop_decoder(procs = None, tag = '[DECODER]'):
+	# stop all stages of decoder chain - returns name of first stage that had exited by itself
+	
+	if procs is None:
+		procs = decoder_procs
+	
+	failed = None
+	for proc in procs:
+		if proc.poll() is not None and failed is None:
+			failed = os.path.basename(proc.args[0])
+			dapnet_log.info(tag,failed,'exited with',proc.returncode)
+	for proc in procs:
+		if proc.poll() is None:
+			proc.terminate()
+	for proc in procs:
+		try:
+			proc.wait(5)
+		except subprocess.TimeoutExpired:
+			proc.kill()
+			proc.wait()
+		if proc.stdout:
+			proc.stdout.close()
+	procs.clear()
+	
+	return failed
 
+def run_decoder():
+	# supervise decoder chain - every failed stage is restarted with the whole chain
+	
+	global decoder_reload
+	
+	if use_native and not native_receivers():
+		return
+	
+	restart_wait = decoder_restart_min
 	while running:
-		for line in sys.stdin:
-			if not running: break
-			
-			line_data = line.rstrip()
-			if debug: print('[STDIN]','received data',line_data)
-			
-			# parse data
-			match_data = MULTIMON.match(line_data)
-			if match_data:
-				m_speed = 1
-				m_ric = int(match_data[1])
-				m_function = int(match_data[2])
-				m_type = match_data[3]
-				message = clean_message(match_data[4])
-				if debug: print('[STDIN]','MSG:',m_ric,m_function,m_type,message)
-				
-				if m_type.lower() == 'alpha':
-					m_type = 6
-				elif m_type.lower() == 'numeric':
-					m_type = 5
+		started = time.monotonic()
+		# with --native rtl_fm only - samples are decoded in process
+		commands = decoder_commands[:1] if use_native else decoder_commands
+		receivers = native_receivers() if use_native else None
+		try:
+			fd = start_decoder(commands)
+		except OSError as e:
+			dapnet_log.error('[DECODER]','ERROR:',e)
+			stop_decoder()
+			failed = 'start'
+		else:
+			eof = read_input(fd, '[DECODER]', 'decoder', decoder_watchdog, receivers)
+			os.close(fd)
+			failed = stop_decoder()
+			if failed is None:
+				failed = 'watchdog' if not eof else 'unknown'
+		
+		if not running:
+			break
+		if decoder_reload:
+			dapnet_log.info('[DECODER]','restart with new settings')
+			decoder_reload = False
+			restart_wait = decoder_restart_min
+			continue
+		
+		# chain that worked for a while is restarted fast again
+		if time.monotonic() - started > decoder_restart_max:
+			restart_wait = decoder_restart_min
+		stats_decoder_restarts.inc(stage=failed)
+		dapnet_log.info('[DECODER]','failed',failed,'- restart',int(stats_decoder_restarts.get(stage=failed)),'in {}s ...'.format(restart_wait))
+		time.sleep(restart_wait)
+		restart_wait = min(restart_wait * 2, decoder_restart_max)
+	
+	return
+
+SOURCE_PATTERN = re.compile(r'^(?:(\w+)=)?(fifo|exec|tcp|stdin)(?::(.*))?$')
+
+class Source:
+	# one input of multimon-ng lines read by read_sources - opened again after errors with backoff
+	
+	def __init__(self, spec, index):
+		self.spec = spec
+		match = SOURCE_PATTERN.match(spec.strip())
+		if not match:
+			raise ValueError('invalid input {}'.format(spec))
+		self.kind = match[2]
+		self.target = (match[3] or '').strip()
+		self.name = match[1] or '{}{}'.format(self.kind, index)
+		self.tag = '[INPUT {}]'.format(self.name)
+		if self.kind == 'exec':
+			self.commands = [command.strip() for command in self.target.split('|') if command.strip()]
+			if not self.commands:
+				raise ValueError('no command in {}'.format(spec))
+		elif self.kind == 'tcp':
+			host, sep, port = self.target.rpartition(':')
+			if not sep or not port.isdigit():
+				raise ValueError('expected tcp:host:port in {}'.format(spec))
+			self.address = (host or '127.0.0.1', int(port))
+		elif self.kind == 'fifo' and not self.target:
+			raise ValueError('no path in {}'.format(spec))
+		
+		# exec and tcp are fed by a receiver that gets time messages every minute - silent means broken
+		self.watchdog = decoder_watchdog if self.kind in ('exec', 'tcp') else 0
+		self.fd = None
+		self.sock = None
+		self.keep = None				# own writer of fifo - no EOF if a writer closes it
+		self.procs = []
+		self.connecting = False
+		self.done = False				# stdin is not opened again after its end
+		self.buffer = b''
+		self.retry_at = 0
+		self.retry_wait = None
+		self.opened = None
+		self.last_read = None
+		self.started = time.monotonic()
+		self.lines = 0
+		self.messages = 0
+		self.invalid = 0
+		self.errors = 0
+	
+	def open(self):
+		# fd to wait for - None if it failed and is tried again later
+		
+		try:
+			if self.kind == 'stdin':
+				self.fd = sys.stdin.fileno()
+			elif self.kind == 'fifo':
+				try:
+					os.mkfifo(self.target)
+				except FileExistsError:
+					pass
+				self.fd = os.open(self.target, os.O_RDONLY | os.O_NONBLOCK)
+				self.keep = os.open(self.target, os.O_WRONLY | os.O_NONBLOCK)
+			elif self.kind == 'exec':
+				self.fd = start_decoder(self.commands, self.procs, self.tag)
+			elif self.kind == 'tcp':
+				self.sock = socket.socket(socket.AF_INET6 if ':' in self.address[0] else socket.AF_INET, socket.SOCK_STREAM)
+				self.sock.setblocking(False)
+				result = self.sock.connect_ex(self.address)
+				if result not in (0, errno.EINPROGRESS):
+					raise OSError(result, os.strerror(result))
+				self.fd = self.sock.fileno()
+				self.connecting = result != 0
+		except OSError as e:
+			dapnet_log.error(self.tag,'ERROR:',e)
+			self.close('open' if self.kind != 'tcp' else 'connect')
+			return None
+		
+		self.opened = self.last_read = time.monotonic()
+		if not self.connecting: dapnet_log.info(self.tag,'open',self.target or self.kind)
+		return self.fd
+	
+	def connected(self):
+		# non-blocking connect of tcp is done - False if it failed
+		
+		self.connecting = False
+		result = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+		if result:
+			dapnet_log.error(self.tag,'ERROR:',os.strerror(result))
+			self.close('connect')
+			return False
+		
+		dapnet_log.info(self.tag,'connected',*self.address)
+		self.last_read = time.monotonic()
+		return True
+	
+	def read(self):
+		# read what is there and parse complete lines - False on end of input
+		
+		try:
+			if self.sock:
+				data = self.sock.recv(65536)
+			else:
+				data = os.read(self.fd, 65536)
+		except BlockingIOError:
+			return True
+		except OSError as e:
+			# pty returns EIO if the command is gone
+			if self.kind != 'exec' or e.errno != errno.EIO:
+				dapnet_log.error(self.tag,'ERROR:',e)
+			data = b''
+		received = self.last_read = time.monotonic()
+		
+		if not data:
+			if self.buffer:
+				# last line without newline
+				self.feed(b'\n', received)
+			return False
+		
+		self.feed(data, received)
+		return True
+	
+	def feed(self, data, received):
+		lines, self.buffer = multimon.split_lines(self.buffer, data)
+		messages, invalid = handle_lines(self.tag, self.name, lines, received)
+		self.lines += len(lines)
+		self.messages += messages
+		self.invalid += invalid
+		return
+	
+	def close(self, error = None):
+		# close input - with error it counts as failure and is opened again after backoff
+		
+		if self.kind == 'exec':
+			if self.fd is not None:
+				os.close(self.fd)
+			failed = stop_decoder(self.procs, self.tag)
+			if error == 'exited' and failed is None:
+				error = 'closed'
+		elif self.sock:
+			self.sock.close()
+		elif self.kind == 'fifo' and self.fd is not None:
+			os.close(self.fd)
+		if self.keep is not None:
+			os.close(self.keep)
+		self.fd = self.sock = self.keep = None
+		self.connecting = False
+		self.buffer = b''
+		
+		if error is None:
+			return
+		
+		self.errors += 1
+		stats_source_errors.inc(source=self.name, error=error)
+		
+		# input that worked for a while is opened again fast
+		restart_min, restart_max = (decoder_restart_min, decoder_restart_max) if self.kind == 'exec' else (reconnect_min, reconnect_max)
+		if self.retry_wait is None or (self.opened and time.monotonic() - self.opened > restart_max):
+			self.retry_wait = restart_min
+		else:
+			self.retry_wait = min(self.retry_wait * 2, restart_max)
+		self.retry_at = time.monotonic() + self.retry_wait
+		dapnet_log.info(self.tag,error,'- open again in {}s ...'.format(self.retry_wait))
+		return
+
+def open_sources():
+	# sources of input_sources - invalid ones are left out
+	
+	result = []
+	for index, spec in enumerate(input_sources):
+		try:
+			result.append(Source(spec, index + 1))
+		except ValueError as e:
+			dapnet_log.error('[INPUT]','ERROR:',e)
+	
+	return result
+
+def read_sources():
+	# read all inputs in one thread - lines of every input go through the same blacklist, duplicate check and queue
+	
+	global sources, sources_reload
+	
+	selector = selectors.DefaultSelector()
+	sources = open_sources()
+	while running:
+		if sources_reload:
+			sources_reload = False
+			dapnet_log.info('[INPUT]','open new inputs')
+			for source in sources:
+				if source.fd is not None:
+					selector.unregister(source.fd)
+					source.close()
+			sources = open_sources()
+		
+		now = time.monotonic()
+		timeout = 1
+		for source in sources:
+			if source.done:
+				continue
+			if source.fd is None:
+				if now >= source.retry_at and source.open() is not None:
+					selector.register(source.fd, selectors.EVENT_WRITE if source.connecting else selectors.EVENT_READ, source)
+				elif source.fd is None:
+					timeout = min(timeout, max(0, source.retry_at - now))
+			elif source.watchdog and now - source.last_read >= source.watchdog:
+				dapnet_log.info(source.tag,'no output for',source.watchdog,'seconds')
+				selector.unregister(source.fd)
+				source.close('watchdog')
+		
+		if not selector.get_map():
+			time.sleep(timeout)
+			continue
+		
+		for key, events in selector.select(timeout):
+			source = key.data
+			if source.connecting:
+				if source.connected():
+					selector.modify(source.fd, selectors.EVENT_READ, source)
 				else:
-					m_type = 0
-					
-				if not m_ric in ric_blacklist:
-					data = '{:1}:{:1}:{}:{:1}:{}'.format(m_type,m_speed,m_ric,m_function,message)
-					message_queue.put(data)
+					selector.unregister(key.fd)
+				continue
+			if not source.read():
+				dapnet_log.info(source.tag,'closed')
+				selector.unregister(key.fd)
+				if source.kind == 'stdin':
+					source.close()
+					source.done = True
 				else:
-					if not silent: print('[STDIN]','message dropped - address blacklisted',m_ric)
-			else:
-				if debug: print('[STDIN]','received invalid message',line_data)
-				pass
+					source.close('exited' if source.kind == 'exec' else 'read')
+	
+	for source in sources:
+		source.close()
+	selector.close()
 	
 	return
 
 
-# register sig_handle
-signal.signal(signal.SIGTERM, signal_handler)
-
-# create que_handler
-if debug: print('[dau_receiver]','init message handler ...')
-que_handler = Thread(target=handle_queue)
-que_handler.start()
+def check_config():
+	# reload config_file when it was changed
+	
+	if dapnet_config.mtime(config_file) != config_mtime:
+		reload_config()
+	
+	return
 
-try:
-	if debug: print('[dau_receiver]','init main loop ...')
+def start(deliver_to = None):
+	global running, deliver, stats_server, que_handler, sources_thread
+	
+	# start inputs - with deliver_to decoded messages go to that function instead of the connection to core
+	# and metrics are left to the process deliver_to belongs to
+	running = True
+	deliver = deliver_to
+	
+	# init stats
+	if stats_port and not deliver:
+		try:
+			stats_server = dapnet_stats.serve(stats_address, stats_port)
+			dapnet_log.info('[STATS]','listen',stats_address,stats_port)
+		except OSError as e:
+			dapnet_log.error('[STATS]','ERROR:',e)
+	
+	# create que_handler
+	if not deliver:
+		dapnet_log.debug('[dau_receiver]','init message handler ...')
+		que_handler = Thread(target=handle_queue)
+		que_handler.start()
+	
+	input_threads.clear()
+	if use_decoder:
+		dapnet_log.debug('[dau_receiver]','init decoder ...')
+		input_threads.append(Thread(target=run_decoder))
+	if input_sources:
+		dapnet_log.debug('[dau_receiver]','init inputs ...')
+		sources_thread = Thread(target=read_sources)
+		input_threads.append(sources_thread)
+	if not input_threads:
+		dapnet_log.debug('[dau_receiver]','init parsing stdin ...')
+		input_threads.append(Thread(target=read_stdin))
+	for thread in input_threads:
+		thread.daemon = True
+		thread.start()
+	
+	return
 
+def stop():
 	if running:
-		if debug: print('[dau_receiver]','init parsing stdin ...')
-		stdin_read = Thread(target=read_stdin)
-		stdin_read.daemon = True
-		stdin_read.start()
+		clean_exit()
+	return
+
+class Receiver:
+	# receiver used as library - settings are the ones of this module, only one receiver per process
+	# (RuntimeError on a second one until the first is stopped), e.g.
+	#   receiver = dapnet_sock.Receiver(['--decoder'], deliver=lambda msg_data, received: print(msg_data))
+	#   receiver.start()
+	# deliver gets (m_type, m_speed, m_ric, m_function, message) and the monotonic time its line was read,
+	# it is called in the input threads and may block to slow them down
 	
-	while running:
-		time.sleep(0.1)
+	def __init__(self, argv = (), deliver = None):
+		global receiver_instance
+		
+		# a second receiver would silently change the settings of the first one
+		if receiver_instance is not None:
+			raise RuntimeError('a receiver is already configured or running in this process')
+		receiver_instance = self
+		try:
+			configure(argv)
+		except BaseException:
+			receiver_instance = None
+			raise
+		self.deliver = deliver
+	
+	def start(self):
+		start(self.deliver)
+		return self
+	
+	def stop(self):
+		global receiver_instance
+		
+		stop()
+		# another Receiver may be configured now
+		if receiver_instance is self:
+			receiver_instance = None
+		return
+	
+	def check_config(self):
+		check_config()
+		return
+	
+	def reload(self):
+		reload_config()
+		return
+	
+	def stats(self):
+		print_stats()
+		return
 
-except KeyboardInterrupt:
-	print('[dau_receiver]','user interrupt CTRL-C')
-	clean_exit()
+def main():
+	configure(sys.argv[1:])
+	
+	# register sig_handle
+	signal.signal(signal.SIGTERM, signal_handler)
+	signal.signal(signal.SIGUSR1, signal_handler)
+	signal.signal(signal.SIGHUP, signal_handler)
+	
+	try:
+		dapnet_log.debug('[dau_receiver]','init main loop ...')
+		start()
+		
+		config_checked = time.monotonic()
+		while running:
+			time.sleep(0.1)
+			
+			# reload config_file when it was changed
+			if config_check and time.monotonic() - config_checked >= config_check:
+				config_checked = time.monotonic()
+				check_config()
+	
+	except KeyboardInterrupt:
+		dapnet_log.notice('[dau_receiver]','user interrupt CTRL-C')
+		clean_exit()
+	
+	dapnet_log.debug('[dau_receiver]','cleanly closed !')
+	dapnet_log.close()
+	sys.exit(0)
 
-if debug: print('[dau_receiver]','cleanly closed !')
-sys.exit(0)
\ No newline at end of file
+if __name__ == '__main__':
+	main()
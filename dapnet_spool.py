@@ -0,0 +1,168 @@
+# copyright (c) 2022 by Rainer Fiedler DO6UK
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+# append-only spool of messages per transmitter for dapnet_dau
+# - messages are kept on disk until the transmitter acked them or spool ttl is over
+#
+# every transmitter has a directory of segments 00000001.log, 00000002.log, ... with one record per line
+#   Q <seq> <time queued> <type:speed:ric:function:text>	message queued
+#   D <seq>													message done (acked, nak or dropped)
+# records are only appended to the newest segment - when it exceeds segment_max and at least half of it
+# is dead (done or expired records), the live messages are compacted into a new segment and all older
+# segments are removed. a full spool grows to twice its live size before the next compaction, so the
+# rewrite costs a constant share per record instead of a rewrite per record
+
+import os,time
+from collections import OrderedDict
+
+class Spool:
+	def __init__(self, path, ttl, segment_max = 1048576, max_entries = 10000):
+		self.path = path
+		self.ttl = ttl
+		self.segment_max = segment_max
+		self.max_entries = max_entries
+		self.live = OrderedDict()		# seq -> [time queued, (m_type, m_speed, m_ric, m_function, message), bytes of record] in order of seq
+		self.live_bytes = 0				# bytes of the Q records of live messages
+		self.seq = 0
+		self.segment = 0
+		self.file = None
+		self.size = 0
+		self.dropped = 0				# messages dropped because spool was full
+		self.expired = 0				# messages dropped because ttl was over
+		
+		os.makedirs(path, exist_ok=True)
+		self.load()
+	
+	def segments(self):
+		return sorted(int(name[:-4]) for name in os.listdir(self.path) if name.endswith('.log') and name[:-4].isdigit())
+	
+	def segment_path(self, segment):
+		return os.path.join(self.path, '{:08}.log'.format(segment))
+	
+	def load(self):
+		# replay all segments - broken lines of an unclean shutdown are skipped
+		
+		segments = self.segments()
+		for segment in segments:
+			with open(self.segment_path(segment), 'r', encoding='utf-8', errors='replace') as file:
+				for line in file:
+					record = line.rstrip('\n').split('\t', 3)
+					try:
+						if record[0] == 'Q' and len(record) == 4 and line.endswith('\n'):
+							m_type, m_speed, m_ric, m_function, message = record[3].split(':', 4)
+							seq = int(record[1])
+							self.live[seq] = [float(record[2]), (int(m_type), int(m_speed), int(m_ric), int(m_function), message), 0]
+							self.seq = max(self.seq, seq)
+						elif record[0] == 'D' and len(record) == 2:
+							self.live.pop(int(record[1]), None)
+					except ValueError:
+						continue
+		
+		self.segment = segments[-1] if segments else 0
+		self.expire()
+		self.compact()
+		return
+	
+	def record(self, seq, ts, page):
+		return 'Q\t{}\t{:.3f}\t{}:{}:{}:{}:{}\n'.format(seq, ts, *page)
+	
+	def write(self, data):
+		self.file.write(data)
+		self.size += len(data)
+		if self.size >= max(self.segment_max, 2 * self.live_bytes):
+			self.compact()
+		return
+	
+	def compact(self):
+		# write live messages into a new segment and remove all older ones
+		
+		if self.file:
+			self.file.close()
+		
+		old = self.segments()
+		self.segment += 1
+		path = self.segment_path(self.segment)
+		self.live_bytes = 0
+		with open(path + '.tmp', 'w', encoding='utf-8') as file:
+			for seq, entry in self.live.items():
+				data = self.record(seq, entry[0], entry[1])
+				entry[2] = len(data)
+				self.live_bytes += entry[2]
+				file.write(data)
+			file.flush()
+			os.fsync(file.fileno())
+		os.replace(path + '.tmp', path)
+		for segment in old:
+			os.remove(self.segment_path(segment))
+		
+		# writes are buffered - flush() pushes them to disk
+		self.file = open(path, 'a', encoding='utf-8', buffering=65536)
+		self.size = self.file.tell()
+		return
+	
+	def append(self, page):
+		# spool message (m_type, m_speed, m_ric, m_function, message) - returns its seq
+		
+		while len(self.live) >= self.max_entries:
+			self.done(next(iter(self.live)))
+			self.dropped += 1
+		
+		self.seq += 1
+		ts = time.time()
+		data = self.record(self.seq, ts, page)
+		self.live[self.seq] = [ts, page, len(data)]
+		self.live_bytes += len(data)
+		self.write(data)
+		return self.seq
+	
+	def done(self, seq):
+		# message is acked or finally dropped - it will not be replayed
+		
+		entry = self.live.pop(seq, None)
+		if entry is not None:
+			self.live_bytes -= entry[2]
+			self.write('D\t{}\n'.format(seq))
+		return
+	
+	def expire(self):
+		# drop messages older than ttl from the front - newer ones follow behind
+		
+		limit = time.time() - self.ttl
+		expired = 0
+		while self.live:
+			seq, (ts, page, size) = next(iter(self.live.items()))
+			if ts >= limit:
+				break
+			self.live.popitem(last=False)
+			self.live_bytes -= size
+			if self.file:
+				self.write('D\t{}\n'.format(seq))
+			expired += 1
+		
+		self.expired += expired
+		return expired
+	
+	def pending(self):
+		# messages not done in order of seq - [(seq, time queued, page)]
+		
+		return [(seq, ts, page) for seq, (ts, page, size) in self.live.items()]
+	
+	def flush(self):
+		if self.file:
+			self.file.flush()
+		return
+	
+	def close(self):
+		if self.file:
+			self.file.close()
+			self.file = None
+		return
@@ -0,0 +1,137 @@
+# copyright (c) 2022 by Rainer Fiedler DO6UK
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+# in-process counters and histograms of dapnet_dau and dapnet_sock
+# served in prometheus text format e.g. curl http://127.0.0.1:9433/metrics
+
+from threading import Thread
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# seconds - fits ack latency, handshake and queuing delay
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300)
+
+metrics = []
+
+def label_key(labels):
+	return tuple(sorted(labels.items()))
+
+def label_text(key):
+	if not key:
+		return ''
+	return '{' + ','.join('{}="{}"'.format(name, str(value).replace('"','\\"')) for name, value in key) + '}'
+
+class Counter:
+	# value only goes up - func returns the value instead, if given
+	
+	kind = 'counter'
+	
+	def __init__(self, name, help, func = None):
+		self.name = name
+		self.help = help
+		self.func = func
+		self.values = {}
+		metrics.append(self)
+	
+	def inc(self, value = 1, **labels):
+		key = label_key(labels)
+		self.values[key] = self.values.get(key, 0) + value
+		return
+	
+	def get(self, **labels):
+		return self.values.get(label_key(labels), 0)
+	
+	def samples(self):
+		if self.func:
+			values = self.func()
+			if not isinstance(values, dict):
+				values = {(): values}
+		else:
+			values = self.values
+		return [(self.name + label_text(key), value) for key, value in list(values.items())]
+
+class Gauge(Counter):
+	# value goes up and down - func may return a dict of label tuple -> value
+	
+	kind = 'gauge'
+	
+	def set(self, value, **labels):
+		self.values[label_key(labels)] = value
+		return
+
+class Histogram:
+	kind = 'histogram'
+	
+	def __init__(self, name, help, buckets = BUCKETS):
+		self.name = name
+		self.help = help
+		self.buckets = buckets
+		self.values = {}		# label key -> [count per bucket, sum, count]
+		metrics.append(self)
+	
+	def observe(self, value, **labels):
+		key = label_key(labels)
+		data = self.values.get(key)
+		if data is None:
+			data = self.values[key] = [[0] * len(self.buckets), 0, 0]
+		for i, bound in enumerate(self.buckets):
+			if value <= bound:
+				data[0][i] += 1
+				break
+		data[1] += value
+		data[2] += 1
+		return
+	
+	def samples(self):
+		result = []
+		for key, (counts, total, count) in list(self.values.items()):
+			cumulative = 0
+			for bound, bucket in zip(self.buckets, counts):
+				cumulative += bucket
+				result.append((self.name + '_bucket' + label_text(key + (('le', bound),)), cumulative))
+			result.append((self.name + '_bucket' + label_text(key + (('le', '+Inf'),)), count))
+			result.append((self.name + '_sum' + label_text(key), total))
+			result.append((self.name + '_count' + label_text(key), count))
+		return result
+
+def render():
+	lines = []
+	for metric in metrics:
+		lines.append('# HELP {} {}'.format(metric.name, metric.help))
+		lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+		for name, value in metric.samples():
+			lines.append('{} {}'.format(name, value))
+	
+	return '\n'.join(lines) + '\n'
+
+class StatsHandler(BaseHTTPRequestHandler):
+	def do_GET(self):
+		body = render().encode('utf-8')
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+		return
+	
+	def log_message(self, format, *args):
+		return
+
+def serve(address, port):
+	# serve metrics in a background thread - returns server to shutdown() on exit
+	
+	server = ThreadingHTTPServer((address, port), StatsHandler)
+	server.daemon_threads = True
+	thread = Thread(target=server.serve_forever, name='STATS')
+	thread.daemon = True
+	thread.start()
+	
+	return server
@@ -0,0 +1,149 @@
+# copyright (c) 2022 by Rainer Fiedler DO6UK
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+# periodic jobs of dapnet_dau on the monotonic clock of the asyncio loop
+# - every job has its own deadline, the next one is the last deadline + interval - no drift by work in between
+# - aligned jobs run on the wall clock boundary (e.g. full minute), it is looked up again for each run
+#   to follow ntp corrections
+# - runs missed because the loop was blocked longer than interval are skipped, not repeated
+#
+# func of a job gets the wall clock time the run was due
+
+import time,asyncio
+import dapnet_log
+
+class Job:
+	def __init__(self, scheduler, name, interval, func, align = False):
+		self.scheduler = scheduler
+		self.name = name
+		self.interval = interval
+		self.func = func
+		self.align = align
+		self.deadline = None			# loop time of next run
+		self.due = None					# wall clock time of next run
+		self.handle = None
+		self.lateness = None			# seconds last run was late
+		self.runs = 0
+		self.missed = 0
+	
+	def start(self, delay = None):
+		# first run after delay - default interval or next boundary of aligned job
+		
+		loop_now = self.scheduler.loop.time()
+		wall_now = time.time()
+		if self.align:
+			self.due = wall_now - wall_now % self.interval + self.interval
+			if delay is not None:
+				self.due = wall_now + delay
+			self.deadline = loop_now + self.due - wall_now
+		else:
+			self.deadline = loop_now + (self.interval if delay is None else delay)
+			self.due = wall_now + self.deadline - loop_now
+		self.arm()
+		return self
+	
+	def arm(self):
+		self.handle = self.scheduler.loop.call_at(self.deadline, self.run)
+		return
+	
+	def advance(self):
+		# deadline of next run - skip runs already missed
+		
+		loop_now = self.scheduler.loop.time()
+		wall_now = time.time()
+		if self.align:
+			due = self.due - self.due % self.interval + self.interval
+			while due <= wall_now:
+				due += self.interval
+				self.missed += 1
+			self.due = due
+			self.deadline = loop_now + due - wall_now
+		else:
+			deadline = self.deadline + self.interval
+			while deadline <= loop_now:
+				deadline += self.interval
+				self.missed += 1
+			self.due += deadline - self.deadline
+			self.deadline = deadline
+		return
+	
+	def run(self):
+		lateness = self.scheduler.loop.time() - self.deadline
+		jitter = abs(lateness - self.lateness) if self.lateness is not None else 0
+		self.lateness = lateness
+		self.runs += 1
+		self.scheduler.observe(self, lateness, jitter)
+		
+		due = self.due
+		self.advance()
+		self.arm()
+		try:
+			self.func(due)
+		except Exception as e:
+			dapnet_log.error('[TIMER]','ERROR:',self.name,repr(e))
+		return
+	
+	def set_interval(self, interval):
+		# new interval from now on - 0 stops job
+		
+		if interval == self.interval:
+			return
+		
+		self.cancel()
+		self.interval = interval
+		if interval > 0:
+			self.start()
+		return
+	
+	def cancel(self):
+		if self.handle:
+			self.handle.cancel()
+			self.handle = None
+		return
+
+class Scheduler:
+	def __init__(self, loop = None, lateness = None, jitter = None, late_warning = 1):
+		self.loop = loop or asyncio.get_running_loop()
+		self.jobs = []
+		self.lateness = lateness				# histograms of dapnet_stats or None
+		self.jitter = jitter
+		self.late_warning = late_warning		# seconds a run may be late without warning
+	
+	def every(self, name, interval, func, align = False, delay = None):
+		# start periodic job - interval 0 creates a stopped job
+		
+		job = Job(self, name, interval, func, align)
+		self.jobs.append(job)
+		if interval > 0:
+			job.start(delay)
+		return job
+	
+	def remove(self, job):
+		job.cancel()
+		if job in self.jobs:
+			self.jobs.remove(job)
+		return
+	
+	def observe(self, job, lateness, jitter):
+		if self.lateness:
+			self.lateness.observe(lateness, job=job.name)
+		if self.jitter:
+			self.jitter.observe(jitter, job=job.name)
+		if lateness > self.late_warning:
+			dapnet_log.notice('[TIMER]',job.name,'late {:.3f}s'.format(lateness))
+		return
+	
+	def close(self):
+		for job in self.jobs:
+			job.cancel()
+		self.jobs = []
+		return
@@ -0,0 +1,59 @@
+# copyright (c) 2022 by Rainer Fiedler DO6UK
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+# parser of multimon-ng pocsag output for dapnet_sock
+
+import re
+import pocsag
+
+MULTIMON = re.compile(r'^POCSAG(512|1200|2400):\sAddress:\s+(\d+)\s+Function:\s+(\d)\s+(Alpha|Numeric):\s+(.+)')
+
+# control characters multimon-ng shows as <XXX> in alpha messages
+CONTROL_CODES = ('DEL','NUL','DLE','SOH','DC','STX','ETX','EOT','ENQ','NAK','ACK','SYN','BEL','ETB','BS','CAN','HT','EM','LF','SUB','VT','ESC','FF','FS','CR','GS','SO','RS','SI','US')
+CONTROL_PATTERN = re.compile('<(?:{})>'.format('|'.join(CONTROL_CODES)))
+
+MESSAGE_TYPES = {'Alpha': pocsag.TYPE_ALPHA, 'Numeric': pocsag.TYPE_NUMERIC}
+
+# baud of multimon-ng demodulator -> speed of dapnet (0=512, 1=1200, 2=2400)
+SPEEDS = {str(baud): m_speed for m_speed, baud in pocsag.BAUD.items()}
+
+def clean_message(msg):
+	# remove all control characters in one pass - most messages have none
+	
+	if '<' not in msg:
+		return msg
+	
+	return CONTROL_PATTERN.sub('', msg)
+
+def parse_line(line):
+	# (m_type, m_speed, m_ric, m_function, message) of a decoded message - None if line is no message
+	
+	if not line.startswith('POCSAG'):
+		return None
+	match_data = MULTIMON.match(line)
+	if not match_data:
+		return None
+	
+	return MESSAGE_TYPES[match_data[4]], SPEEDS[match_data[1]], int(match_data[2]), int(match_data[3]), clean_message(match_data[5].rstrip())
+
+def split_lines(buffer, data):
+	# complete lines of buffer and data read - returns lines and the unterminated rest
+	
+	lines = (buffer + data).split(b'\n')
+	rest = lines.pop()
+	
+	return [line.decode('utf-8', 'replace') for line in lines], rest
+
+def format_line(m_type, m_speed, m_ric, m_function, message):
+	# message as multimon-ng prints it
+	
+	return 'POCSAG{}: Address: {:7}  Function: {}  {} {}'.format(pocsag.BAUD[m_speed], m_ric, m_function, 'Numeric:' if m_type == pocsag.TYPE_NUMERIC else 'Alpha:  ', message)
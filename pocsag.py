@@ -0,0 +1,297 @@
+# copyright (c) 2022 by Rainer Fiedler DO6UK
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+# pocsag helpers for dapnet_dau and dapnet_sock
+
+# speed field of dapnet messages -> baud
+BAUD = {0: 512, 1: 1200, 2: 2400}
+
+# message types of dapnet messages
+TYPE_NUMERIC = 5
+TYPE_ALPHA = 6
+
+PREAMBLE_BITS = 576
+CODEWORD_BITS = 32
+BATCH_CODEWORDS = 16
+BATCH_BITS = CODEWORD_BITS + BATCH_CODEWORDS * CODEWORD_BITS	# sync codeword + 8 frames of 2 codewords
+DATA_BITS = 20	# payload bits of a message codeword
+
+def message_codewords(m_type, message):
+	# codewords following the address codeword - numeric has 4 bits per digit, alpha 7 bits per char
+	
+	if m_type == TYPE_NUMERIC:
+		bits = 4 * len(message)
+	elif m_type == TYPE_ALPHA:
+		bits = 7 * len(message)
+	else:
+		bits = 0
+	
+	return -(-bits // DATA_BITS)
+
+def codewords(m_type, message):
+	# address codeword and message codewords
+	
+	return 1 + message_codewords(m_type, message)
+
+def batches(m_type, m_ric, message):
+	# batches of a single message - address codeword has to be in frame ric & 7
+	
+	return -(-(2 * (m_ric & 7) + codewords(m_type, message)) // BATCH_CODEWORDS)
+
+def airtime(m_type, m_speed, m_ric, message):
+	# seconds a single message with preamble is on air
+	
+	return (PREAMBLE_BITS + batches(m_type, m_ric, message) * BATCH_BITS) / BAUD[m_speed]
+
+def packed_airtime(m_type, m_speed, message):
+	# average seconds a message adds to a transmission - address waits 7 idle codewords for its frame on average
+	
+	return (codewords(m_type, message) + 7) * BATCH_BITS / BATCH_CODEWORDS / BAUD[m_speed]
+
+class Transmission:
+	# messages sent back to back like a transmitter does in its timeslot
+	# - one preamble per speed, every address codeword waits for its frame
+	
+	def __init__(self):
+		self.position = {}		# speed -> codewords used incl. idle codewords
+		self.airtime = 0
+		self.messages = 0
+	
+	def place(self, m_type, m_speed, m_ric, message):
+		# codeword position after adding message and seconds it adds to transmission
+		
+		position = self.position.get(m_speed)
+		if position is None:
+			position = 0
+			cost = PREAMBLE_BITS
+		else:
+			cost = 0
+		
+		frame = m_ric & 7
+		index = position % BATCH_CODEWORDS
+		if index // 2 != frame:
+			position += (2 * frame - index) % BATCH_CODEWORDS
+		end = position + codewords(m_type, message)
+		
+		used = -(-self.position.get(m_speed, 0) // BATCH_CODEWORDS)
+		cost += (-(-end // BATCH_CODEWORDS) - used) * BATCH_BITS
+		
+		return end, cost / BAUD[m_speed]
+	
+	def cost(self, m_type, m_speed, m_ric, message):
+		# seconds message would add to transmission
+		
+		return self.place(m_type, m_speed, m_ric, message)[1]
+	
+	def add(self, m_type, m_speed, m_ric, message):
+		end, cost = self.place(m_type, m_speed, m_ric, message)
+		self.position[m_speed] = end
+		self.airtime += cost
+		self.messages += 1
+		
+		return cost
+
+# codewords of the air protocol
+SYNC_CODEWORD = 0x7CD215D8
+IDLE_CODEWORD = 0x7A89C197
+
+# generator polynomial of BCH(31,21) - x^10 + x^9 + x^8 + x^6 + x^5 + x^3 + 1
+BCH_POLY = 0x769
+
+# digits of numeric messages - 4 bits each
+NUMERIC_CHARS = '0123456789*U -)('
+
+# syndrome -> error pattern of all single and double bit errors - built on first use
+bch_errors = {}
+
+def bch_remainder(value):
+	# remainder of 31 bit codeword (without parity) divided by BCH_POLY
+	
+	for bit in range(30, 9, -1):
+		if value & (1 << bit):
+			value ^= BCH_POLY << (bit - 10)
+	
+	return value
+
+def bch_encode(data):
+	# 32 bit codeword of 21 bits data - 10 bits bch and even parity
+	
+	value = (data << 10) | bch_remainder(data << 10)
+	
+	return (value << 1) | (bin(value).count('1') & 1)
+
+def bch_correct(codeword):
+	# corrected codeword - None if more than 2 bits are wrong
+	
+	syndrome = bch_remainder(codeword >> 1)
+	if syndrome:
+		if not bch_errors:
+			for i in range(0, 31):
+				bch_errors[bch_remainder(1 << i)] = 1 << i
+				for j in range(0, i):
+					bch_errors[bch_remainder((1 << i) | (1 << j))] = (1 << i) | (1 << j)
+		error = bch_errors.get(syndrome)
+		if error is None:
+			return None
+		codeword ^= error << 1
+	
+	# parity bit is not used for correction - it is just set again
+	return (codeword & ~1) | (bin(codeword >> 1).count('1') & 1)
+
+def decode_alpha(bits):
+	# text of message bits - 7 bits per char, least significant bit first, control characters are dropped
+	
+	chars = []
+	for i in range(0, len(bits) - 6, 7):
+		char = 0
+		for bit in reversed(bits[i:i + 7]):
+			char = (char << 1) | bit
+		if 32 <= char < 127:
+			chars.append(chr(char))
+	
+	return ''.join(chars)
+
+def decode_numeric(bits):
+	# digits of message bits - 4 bits per digit, least significant bit first
+	
+	digits = []
+	for i in range(0, len(bits) - 3, 4):
+		digit = bits[i] | (bits[i + 1] << 1) | (bits[i + 2] << 2) | (bits[i + 3] << 3)
+		digits.append(NUMERIC_CHARS[digit])
+	
+	return ''.join(digits).rstrip()
+
+class Decoder:
+	# collects corrected codewords of batches into messages
+	# - function 0 is taken as numeric message like dapnet sends them, all others as alpha
+	
+	def __init__(self, m_speed):
+		self.m_speed = m_speed
+		self.m_ric = None
+		self.m_function = 0
+		self.bits = []
+		self.messages = []			# (m_type, m_speed, m_ric, m_function, message) decoded since last take()
+		self.errors = 0				# codewords not correctable
+	
+	def batch(self, codewords):
+		# 16 codewords following a sync codeword
+		
+		for index, codeword in enumerate(codewords):
+			codeword = bch_correct(codeword)
+			if codeword is None:
+				# message is broken - drop it
+				self.errors += 1
+				self.m_ric = None
+				self.bits = []
+			elif codeword >> 1 == IDLE_CODEWORD >> 1:
+				self.flush()
+			elif not codeword & 0x80000000:
+				self.flush()
+				self.m_ric = ((codeword >> 13) << 3) | (index >> 1)
+				self.m_function = (codeword >> 11) & 3
+			elif self.m_ric is not None:
+				data = (codeword >> 11) & 0xFFFFF
+				self.bits.extend((data >> bit) & 1 for bit in range(19, -1, -1))
+		
+		return
+	
+	def flush(self):
+		# end of message - address without message bits is a tone only page
+		
+		if self.m_ric is not None:
+			if self.m_function == 0:
+				m_type, message = TYPE_NUMERIC, decode_numeric(self.bits)
+			else:
+				m_type, message = TYPE_ALPHA, decode_alpha(self.bits)
+			self.messages.append((m_type, self.m_speed, self.m_ric, self.m_function, message))
+		self.m_ric = None
+		self.bits = []
+		return
+	
+	def take(self):
+		messages = self.messages
+		self.messages = []
+		return messages
+
+def encode_alpha(message):
+	# message bits - 7 bits per char, least significant bit first
+	
+	bits = []
+	for char in message:
+		value = ord(char) & 0x7F
+		bits.extend((value >> bit) & 1 for bit in range(0, 7))
+	
+	return bits
+
+def encode_numeric(message):
+	# message bits - 4 bits per digit, least significant bit first, unknown chars are sent as space
+	
+	bits = []
+	for char in message:
+		value = NUMERIC_CHARS.find(char)
+		if value < 0:
+			value = NUMERIC_CHARS.index(' ')
+		bits.extend((value >> bit) & 1 for bit in range(0, 4))
+	
+	return bits
+
+def message_words(m_type, m_ric, m_function, message):
+	# address codeword and message codewords of a message
+	
+	words = [bch_encode(((m_ric >> 3) << 2) | (m_function & 3))]
+	if m_type == TYPE_NUMERIC:
+		bits = encode_numeric(message)
+		# numeric is filled up with spaces
+		while len(bits) % DATA_BITS:
+			bits.extend((0, 0, 1, 1))
+	elif m_type == TYPE_ALPHA:
+		bits = encode_alpha(message)
+		while len(bits) % DATA_BITS:
+			bits.append(0)
+	else:
+		bits = []
+	
+	for i in range(0, len(bits), DATA_BITS):
+		data = 1
+		for bit in bits[i:i + DATA_BITS]:
+			data = (data << 1) | bit
+		words.append(bch_encode(data))
+	
+	return words
+
+def encode(messages):
+	# codewords of batches (without sync codeword) of messages (m_type, m_ric, m_function, message)
+	# sent back to back - every address codeword waits for its frame
+	
+	words = []
+	for m_type, m_ric, m_function, message in messages:
+		frame = m_ric & 7
+		while len(words) % BATCH_CODEWORDS != 2 * frame:
+			words.append(IDLE_CODEWORD)
+		words.extend(message_words(m_type, m_ric, m_function, message))
+	
+	# idle codeword ends the last message
+	words.append(IDLE_CODEWORD)
+	while len(words) % BATCH_CODEWORDS:
+		words.append(IDLE_CODEWORD)
+	
+	return [words[i:i + BATCH_CODEWORDS] for i in range(0, len(words), BATCH_CODEWORDS)]
+
+def transmission_bits(messages):
+	# bits on air of a transmission - preamble, then sync codeword and 16 codewords per batch
+	
+	bits = [1, 0] * (PREAMBLE_BITS // 2)
+	for batch in encode(messages):
+		for word in [SYNC_CODEWORD] + batch:
+			bits.extend((word >> bit) & 1 for bit in range(31, -1, -1))
+	
+	return bits
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+# copyright (c) 2022 by Rainer Fiedler DO6UK
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+# pocsag baseband generator - audio like a fm demodulator (e.g. rtl_fm) outputs, signed 16 bit mono
+# to test multimon-ng, pocsag_rx.py and dapnet_sock.py without a transmitter:
+#
+# ./pocsag_gen.py 6:1:1234:3:hello 5:1:2504:0:123456 | multimon-ng -a POCSAG1200 -t raw -
+# ./pocsag_gen.py --snr 6 --offset 0.1 -o test.raw < messages.txt
+
+import sys,re,random,wave,argparse
+from array import array
+import pocsag
+
+# messages in the format of dapnet_dau - type:speed:ric:function:text
+MSG_PATTERN = re.compile(r'^(\d):(\d):(\d+):(\d):(.*)')
+
+def parse_message(data):
+	# (m_type, m_speed, m_ric, m_function, message) - None if data is no message
+	
+	msg_data = MSG_PATTERN.match(data.rstrip('\r\n'))
+	if not msg_data or int(msg_data[2]) not in pocsag.BAUD:
+		return None
+	
+	return int(msg_data[1]), int(msg_data[2]), int(msg_data[3]), int(msg_data[4]), msg_data[5]
+
+def transmissions(messages, single = False):
+	# messages of the same speed following each other are sent in one transmission - [(m_speed, bits)]
+	
+	result = []
+	group = []
+	for m_type, m_speed, m_ric, m_function, message in messages:
+		if group and (single or group[0][0] != m_speed):
+			result.append((group[0][0], pocsag.transmission_bits([page[1:] for page in group])))
+			group = []
+		group.append((m_speed, m_type, m_ric, m_function, message))
+	if group:
+		result.append((group[0][0], pocsag.transmission_bits([page[1:] for page in group])))
+	
+	return result
+
+def synthesise(bits, baud, rate = 22050, level = 8000, snr = None, offset = 0, ppm = 0, invert = False, rng = random):
+	# samples of bits - level is the deviation, offset the frequency offset as part of the deviation,
+	# snr in dB (None without noise), ppm the clock error of the transmitter
+	
+	sign = -1 if invert else 1
+	sigma = level / 10 ** (snr / 20) if snr is not None else 0
+	step = baud * (1 + ppm / 1e6) / rate
+	smooth = min(1, 2 * baud / rate)		# receiver filter - one pole low pass
+	
+	samples = array('h')
+	value = 0
+	count = int(len(bits) / step)
+	for n in range(0, count):
+		bit = bits[int(n * step)]
+		# pocsag sends 1 on the lower frequency
+		value += smooth * ((-level if bit else level) * sign - value)
+		sample = value + offset * level
+		if sigma:
+			sample += rng.gauss(0, sigma)
+		samples.append(max(-32768, min(32767, int(sample))))
+	
+	return samples
+
+def silence(seconds, rate = 22050, level = 8000, snr = None, rng = random):
+	# noise between transmissions
+	
+	sigma = level / 10 ** (snr / 20) if snr is not None else 0
+	samples = array('h')
+	for n in range(0, int(seconds * rate)):
+		samples.append(max(-32768, min(32767, int(rng.gauss(0, sigma)))) if sigma else 0)
+	
+	return samples
+
+def generate(messages, rate = 22050, level = 8000, snr = None, offset = 0, ppm = 0, invert = False, gap = 0.5, single = False, seed = None):
+	# samples of all messages with gap seconds of silence before, between and after transmissions
+	
+	rng = random.Random(seed)
+	samples = silence(gap, rate, level, snr, rng)
+	for m_speed, bits in transmissions(messages, single):
+		samples.extend(synthesise(bits, pocsag.BAUD[m_speed], rate, level, snr, offset, ppm, invert, rng))
+		samples.extend(silence(gap, rate, level, snr, rng))
+	
+	return samples
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='pocsag baseband audio (signed 16 bit mono) of type:speed:ric:function:text messages')
+	parser.add_argument('messages', nargs='*', help='messages - read from stdin if none given')
+	parser.add_argument('-o', '--output', default='-', help='raw samples or .wav file - default stdout')
+	parser.add_argument('--rate', type=int, default=22050, help='samples per second')
+	parser.add_argument('--level', type=int, default=8000, help='deviation as sample value')
+	parser.add_argument('--snr', type=float, default=None, help='signal to noise ratio in dB - default no noise')
+	parser.add_argument('--offset', type=float, default=0, help='frequency offset as part of the deviation, e.g. 0.1')
+	parser.add_argument('--ppm', type=float, default=0, help='clock error of transmitter in ppm')
+	parser.add_argument('--invert', action='store_true', help='invert polarity')
+	parser.add_argument('--gap', type=float, default=0.5, help='seconds of silence between transmissions')
+	parser.add_argument('--single', action='store_true', help='one transmission per message')
+	parser.add_argument('--seed', type=int, default=None, help='seed of noise - same seed, same samples')
+	args = parser.parse_args()
+	
+	messages = []
+	for data in (args.messages or sys.stdin):
+		message = parse_message(data)
+		if message is None:
+			print('[pocsag_gen]','invalid message',data.rstrip(),file=sys.stderr)
+			continue
+		messages.append(message)
+	
+	samples = generate(messages, args.rate, args.level, args.snr, args.offset, args.ppm, args.invert, args.gap, args.single, args.seed)
+	if sys.byteorder != 'little':
+		samples.byteswap()
+	
+	if args.output.endswith('.wav'):
+		with wave.open(args.output, 'wb') as output:
+			output.setnchannels(1)
+			output.setsampwidth(2)
+			output.setframerate(args.rate)
+			output.writeframes(samples.tobytes())
+	elif args.output == '-':
+		sys.stdout.buffer.write(samples.tobytes())
+	else:
+		with open(args.output, 'wb') as output:
+			output.write(samples.tobytes())
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+# copyright (c) 2022 by Rainer Fiedler DO6UK
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+# pocsag receiver for raw audio of a fm demodulator (e.g. rtl_fm, signed 16 bit mono) - needs numpy
+# used by dapnet_sock --native or standalone like multimon-ng:
+#
+# rtl_fm -E dc -f 439.9875M -s 22050 - | ./pocsag_rx.py
+# ./pocsag_rx.py --rate 22050 --speed 1 recorded.raw
+
+import sys,argparse
+import pocsag, multimon
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# bit errors allowed in sync codeword
+SYNC_ERRORS = 2
+
+# bits of a batch - sync codeword and 16 codewords
+BATCH_BITS = pocsag.BATCH_BITS
+
+# bits per clock estimate - short enough to follow clock drift of soundcards
+CLOCK_BITS = 256
+
+class Receiver:
+	# demodulates, syncs and decodes messages of one speed
+	
+	def __init__(self, m_speed = 1, rate = 22050):
+		if numpy is None:
+			raise ImportError('pocsag_rx needs numpy')
+		
+		self.m_speed = m_speed
+		self.sps = rate / pocsag.BAUD[m_speed]			# samples per bit
+		self.decoder = pocsag.Decoder(m_speed)
+		self.window = max(1, int(round(self.sps)))		# matched filter - mean over one bit
+		self.tail = numpy.zeros(self.window - 1, numpy.float32)
+		self.dc = 0.0
+		self.samples = numpy.zeros(0, numpy.float32)		# filtered samples not sampled yet
+		self.offset = 0.0								# position of next bit in samples
+		self.bits = numpy.zeros(0, numpy.int8)			# bits (+1/-1) not decoded yet
+		self.polarity = 0								# +1/-1 while in a transmission, 0 while searching sync
+		self.batches = 0
+		
+		sync = numpy.array([(pocsag.SYNC_CODEWORD >> bit) & 1 for bit in range(31, -1, -1)], numpy.int8)
+		self.sync = sync * 2 - 1
+		self.weights = numpy.array([1 << bit for bit in range(31, -1, -1)], numpy.int64)
+	
+	def feed(self, samples):
+		# raw samples (numpy int16) - returns messages (m_type, m_speed, m_ric, m_function, message) completed
+		
+		samples = numpy.asarray(samples, numpy.float32)
+		if samples.size:
+			# fm demodulator shows frequency offset as dc
+			self.dc = 0.8 * self.dc + 0.2 * float(samples.mean())
+			samples = numpy.concatenate((self.tail, samples - self.dc))
+			self.tail = samples[len(samples) - self.window + 1:] if self.window > 1 else self.tail
+			filtered = numpy.convolve(samples, numpy.ones(self.window, numpy.float32) / self.window, 'valid')
+			self.samples = numpy.concatenate((self.samples, filtered))
+		
+		self.clock()
+		self.scan()
+		
+		return self.decoder.take()
+	
+	def clock(self):
+		# sample bits at the phase with the largest eye opening - estimated every CLOCK_BITS
+		
+		chunk = int(CLOCK_BITS * self.sps)
+		while len(self.samples) - self.offset >= chunk + self.sps:
+			count = int((chunk - 1) / self.sps)
+			positions = self.offset + numpy.arange(count) * self.sps
+			shifts = numpy.linspace(-0.375, 0.375, 7) * self.sps
+			index = numpy.rint(positions[None, :] + shifts[:, None]).astype(numpy.int64)
+			index = numpy.clip(index, 0, len(self.samples) - 1)
+			opening = numpy.abs(self.samples[index]).mean(axis=1)
+			best = int(opening.argmax())
+			
+			values = self.samples[index[best]]
+			self.bits = numpy.concatenate((self.bits, numpy.where(values >= 0, 1, -1).astype(numpy.int8)))
+			self.offset = positions[-1] + shifts[best] + self.sps
+			
+			# forget samples already used
+			drop = int(self.offset) - 1
+			if drop > 0:
+				self.samples = self.samples[drop:]
+				self.offset -= drop
+		
+		return
+	
+	def scan(self):
+		# find sync codeword and decode the batches following it
+		
+		position = 0
+		bits = self.bits
+		while True:
+			if self.polarity:
+				if len(bits) - position < BATCH_BITS:
+					break
+				errors = int(numpy.count_nonzero(bits[position:position + 32] * self.polarity != self.sync))
+				if errors > SYNC_ERRORS:
+					# end of transmission
+					self.decoder.flush()
+					self.polarity = 0
+					continue
+				data = bits[position + 32:position + BATCH_BITS] * self.polarity > 0
+				codewords = data.reshape(16, 32).astype(numpy.int64) @ self.weights
+				self.decoder.batch([int(codeword) for codeword in codewords])
+				self.batches += 1
+				position += BATCH_BITS
+			else:
+				if len(bits) - position < 32:
+					break
+				correlation = numpy.correlate(bits[position:].astype(numpy.int32), self.sync.astype(numpy.int32), 'valid')
+				found = numpy.flatnonzero(numpy.abs(correlation) >= 32 - 2 * SYNC_ERRORS)
+				if not found.size:
+					position = len(bits) - 31
+					break
+				position += int(found[0])
+				self.polarity = 1 if correlation[found[0]] > 0 else -1
+		
+		self.bits = bits[position:]
+		return
+
+def read_samples(stream, receivers, chunk = 65536):
+	# feed raw samples of stream to all receivers - yields messages
+	
+	# read1 returns what is there - no waiting for a whole chunk
+	read = getattr(stream, 'read1', stream.read)
+	rest = b''
+	while True:
+		data = read(chunk)
+		if not data:
+			break
+		data = rest + data
+		rest = data[len(data) & ~1:]
+		samples = numpy.frombuffer(data[:len(data) & ~1], numpy.int16)
+		for receiver in receivers:
+			yield from receiver.feed(samples)
+	
+	for receiver in receivers:
+		receiver.decoder.flush()
+		yield from receiver.decoder.take()
+	
+	return
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='decode pocsag from raw audio (signed 16 bit mono) - prints lines like multimon-ng')
+	parser.add_argument('file', nargs='?', default='-', help='raw samples - default stdin')
+	parser.add_argument('--rate', type=int, default=22050, help='samples per second')
+	parser.add_argument('--speed', type=int, action='append', choices=sorted(pocsag.BAUD), help='speed to decode (0=512, 1=1200, 2=2400) - default 1, may be repeated')
+	args = parser.parse_args()
+	
+	stream = sys.stdin.buffer if args.file == '-' else open(args.file, 'rb')
+	receivers = [Receiver(m_speed, args.rate) for m_speed in (args.speed or [1])]
+	for message in read_samples(stream, receivers):
+		print(multimon.format_line(*message), flush=True)
@@ -12,4 +12,6 @@
 #  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 #  GNU General Public License for more details.
 
-rtl_fm -E dc -f 439.9875M -s 22050 - | multimon-ng -a POCSAG1200 -t raw /dev/stdin | ./dapnet_sock.py
+# dapnet_sock.py --decoder starts and supervises the same chain itself (see decoder_commands)
+
+rtl_fm -E dc -f 439.9875M -s 22050 - | multimon-ng -a POCSAG512 -a POCSAG1200 -a POCSAG2400 -t raw /dev/stdin | ./dapnet_sock.py